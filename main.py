@@ -1,14 +1,25 @@
+import time
+STARTED = time.perf_counter()
+import importlib
 import tkinter as tk
 from tkinter import ttk
 from pages.login import LoginPage
 from pages.signup import SignupPage
-from pages.planning import PlanningPage
-from pages.tracking import TrackingPage
-from pages.dashboard import DashboardPage
-from pages.settings import SettingsPage
 from utils.database import Database
-from utils.logging import setup_logging, log_info
+from utils.executor import QueryExecutor
+from utils.logging import setup_logging, shutdown_logging, log_info
+from utils.profiler import PROFILER
+from utils.sqltrace import TRACER
 from styles import apply_styles
+IMPORTED = time.perf_counter()
+
+# User pages are imported and built on first show_page: page name -> (module, class)
+USER_PAGES = {
+    "Planning": ("pages.planning", "PlanningPage"),
+    "Tracking": ("pages.tracking", "TrackingPage"),
+    "Dashboard": ("pages.dashboard", "DashboardPage"),
+    "Settings": ("pages.settings", "SettingsPage"),
+}
 
 class PennyApp(tk.Tk):
     def __init__(self):
@@ -17,9 +28,58 @@ class PennyApp(tk.Tk):
         self.current_user = None
         setup_logging()
         apply_styles()
+        tk_ready = time.perf_counter()
         self.db = Database()
+        self.executor = QueryExecutor(self, profiler=PROFILER)
+        if PROFILER:
+            PROFILER.instrument_database(self.db)
+            PROFILER.instrument(self, ("set_user", "show_page", "build_page"), "ui")
+            self.bind_all("<Control-Alt-p>", lambda event: PROFILER.toggle_cprofile())
+        if TRACER:
+            self.bind_all("<Control-Alt-q>", lambda event: self.show_sql_trace())
+        db_ready = time.perf_counter()
         self.init_ui()
         self.check_logged_in_user()
+        self.startup_phases = {
+            "imports": IMPORTED - STARTED,
+            "tk": tk_ready - IMPORTED,
+            "database": db_ready - tk_ready,
+            "first page": time.perf_counter() - db_ready,
+        }
+        self.after_idle(self.report_startup)
+
+    def report_startup(self):
+        """Log how long each startup phase took, once the first window has been laid out."""
+        phases = "  ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.startup_phases.items())
+        log_info(0, f"Startup {(time.perf_counter() - STARTED) * 1000:.0f} ms: {phases}")
+        if PROFILER:
+            for name, seconds in self.startup_phases.items():
+                PROFILER.record(f"startup:{name}", seconds)
+
+    def show_sql_trace(self):
+        """Open a window listing the traced SQL statements, slowest total first."""
+        popup = tk.Toplevel(self)
+        popup.title("SQL Trace")
+        popup.geometry("900x500")
+        text = tk.Text(popup, wrap="none", font=("Courier", 9))
+        scrollbar = ttk.Scrollbar(popup, orient="vertical", command=text.yview)
+        text.configure(yscrollcommand=scrollbar.set)
+
+        def refresh():
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, "\n".join(TRACER.format_summary(limit=100)) or "No statements traced yet")
+
+        def reset():
+            TRACER.reset()
+            refresh()
+
+        buttons = ttk.Frame(popup)
+        buttons.pack(side=tk.BOTTOM, fill="x", pady=5)
+        ttk.Button(buttons, text="Refresh", command=refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Reset", command=reset).pack(side=tk.LEFT, padx=5)
+        scrollbar.pack(side=tk.RIGHT, fill="y")
+        text.pack(fill="both", expand=True)
+        refresh()
 
     def init_ui(self):
         """Initialize the main application UI."""
@@ -27,9 +87,9 @@ class PennyApp(tk.Tk):
         self.container.pack(fill="both", expand=True)
 
         self.pages = {
-            "Login": LoginPage(self.container, self.show_page, self.set_user),
-            "Signup": SignupPage(self.container, self.show_page),
-            "Planning": None,  # Initialized later in set_user
+            "Login": LoginPage(self.container, self.show_page, self.set_user, self.db),
+            "Signup": SignupPage(self.container, self.show_page, self.db),
+            "Planning": None,  # Built on first show_page after set_user
             "Tracking": None,
             "Dashboard": None,
             "Settings": None
@@ -58,30 +118,33 @@ class PennyApp(tk.Tk):
     def set_user(self, user_id):
         """Set the current user and initialize user-specific pages."""
         self.current_user = user_id
+        self.db.load_user(user_id)  # profile and settings for every page, in one query
         # Destroy old user-specific pages if they exist
-        for page_name in ["Planning", "Tracking", "Dashboard", "Settings"]:
+        for page_name in USER_PAGES:
             if self.pages[page_name]:
                 self.pages[page_name].pack_forget()
                 self.pages[page_name].destroy()
+                self.pages[page_name] = None
 
-        # Create new instances with current_user
-        self.pages["Planning"] = PlanningPage(self.container, self.show_page, self.current_user)
-        self.pages["Tracking"] = TrackingPage(self.container, self.show_page, self.current_user)
-        self.pages["Dashboard"] = DashboardPage(self.container, self.show_page, self.current_user)
-        self.pages["Settings"] = SettingsPage(self.container, self.show_page, self.current_user)
-
-        # Pack all pages and hide them
-        for page_name, page in self.pages.items():
-            page.pack(fill="both", expand=True)
-            page.pack_forget()
-
+        # Pages for the new user are built by show_page the first time they are shown
         self.geometry("1000x700")
         self.center_window(1000, 700)
         self.show_page("Dashboard")
         log_info(self.current_user, "User logged in and switched to Dashboard")
 
+    def build_page(self, page_name):
+        """Import and construct a user page on first use."""
+        started = time.perf_counter()
+        module, class_name = USER_PAGES[page_name]
+        page_class = getattr(importlib.import_module(module), class_name)
+        # All pages share the app's Database, so the schema is checked once per process
+        page = page_class(self.container, self.show_page, self.current_user, self.db, self.executor)
+        self.pages[page_name] = page
+        log_info(self.current_user, f"Built {page_name} page in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return page
+
     def show_page(self, page_name):
-        """Show the specified page."""
+        """Show the specified page, building it first if needed."""
         for page in self.pages.values():
             if page:  # Skip None pages
                 page.pack_forget()
@@ -96,7 +159,8 @@ class PennyApp(tk.Tk):
         else:
             self.geometry("1000x700")
             self.center_window(1000, 700)
-        self.pages[page_name].pack(fill="both", expand=True)
+        page = self.pages[page_name] or self.build_page(page_name)
+        page.pack(fill="both", expand=True)
         log_info(self.current_user or 0, f"Switched to {page_name} page")
 
     def check_logged_in_user(self):
@@ -111,8 +175,14 @@ class PennyApp(tk.Tk):
 
     def destroy(self):
         """Clean up resources before closing."""
+        self.executor.shutdown()
         self.db.close()
+        if PROFILER:
+            PROFILER.shutdown()
+        if TRACER:
+            TRACER.write_summary()
         super().destroy()
+        shutdown_logging()
 
 if __name__ == "__main__":
     app = PennyApp()
@@ -0,0 +1,148 @@
+import tkinter as tk
+from tkinter import ttk
+import calendar
+from datetime import datetime
+from utils.logging import log_info, log_debug, log_error
+
+class AgendaWindow(tk.Toplevel):
+    """Month calendar of plan due dates read from the plan_occurrences index.
+
+    Only the visible month is queried and drawn; the months either side are
+    prefetched in the background so paging through them is instant.
+    """
+    def __init__(self, parent, db, executor, user_id, year=None, month=None):
+        super().__init__(parent)
+        self.db = db
+        self.executor = executor
+        self.user_id = user_id
+        today = datetime.now()
+        self.year = year or today.year
+        self.month = month or today.month
+        self.months = {}  # (year, month) -> due rows, valid for self.version
+        self.version = None
+        self.title("Upcoming Obligations")
+        self.geometry("760x560")
+        self.transient(parent)
+        self.init_ui()
+        self.show_month()
+
+    def init_ui(self):
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(2, weight=1)
+
+        header = ttk.Frame(self)
+        header.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
+        ttk.Button(header, text="<", width=3, command=lambda: self.step(-1)).pack(side=tk.LEFT, padx=3)
+        self.month_label = ttk.Label(header, text="", font=("Arial", 12, "bold"), width=18, anchor="center")
+        self.month_label.pack(side=tk.LEFT, padx=3)
+        ttk.Button(header, text=">", width=3, command=lambda: self.step(1)).pack(side=tk.LEFT, padx=3)
+        ttk.Button(header, text="Today", command=self.show_today).pack(side=tk.LEFT, padx=10)
+        self.total_label = ttk.Label(header, text="")
+        self.total_label.pack(side=tk.RIGHT, padx=5)
+
+        # A fixed 6x7 grid of day cells whose text is replaced for each month
+        grid = ttk.Frame(self)
+        grid.grid(row=1, column=0, sticky="nsew", padx=5)
+        for column, day in enumerate(calendar.day_abbr):
+            ttk.Label(grid, text=day, anchor="center").grid(row=0, column=column, sticky="ew")
+            grid.grid_columnconfigure(column, weight=1, uniform="day")
+        self.cells = []
+        for week in range(6):
+            for column in range(7):
+                cell = tk.Label(grid, text="", anchor="nw", justify=tk.LEFT, relief=tk.GROOVE,
+                                width=12, height=4, wraplength=95, font=("Arial", 8))
+                cell.grid(row=week + 1, column=column, sticky="nsew")
+                self.cells.append(cell)
+
+        list_frame = ttk.Frame(self)
+        list_frame.grid(row=2, column=0, sticky="nsew", padx=5, pady=5)
+        list_frame.grid_columnconfigure(0, weight=1)
+        list_frame.grid_rowconfigure(0, weight=1)
+        self.tree = ttk.Treeview(list_frame, columns=("Date", "Type", "Category", "Amount", "Recurrence"),
+                                 show="headings", height=6)
+        for column, text in (("Date", "Date"), ("Type", "Type"), ("Category", "Category"),
+                             ("Amount", "Plan Amount (KSh)"), ("Recurrence", "Recurrence")):
+            self.tree.heading(column, text=text)
+            self.tree.column(column, width=120, anchor="center")
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.tree.yview)
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        self.tree.configure(yscrollcommand=scrollbar.set)
+
+    def step(self, months):
+        index = self.year * 12 + self.month - 1 + months
+        self.year, self.month = divmod(index, 12)
+        self.month += 1
+        self.show_month()
+
+    def show_today(self):
+        today = datetime.now()
+        self.year, self.month = today.year, today.month
+        self.show_month()
+
+    def check_version(self):
+        """Drop prefetched months once the user's plans may have changed."""
+        version = self.db.data_version(self.user_id)
+        if version != self.version:
+            self.months = {}
+            self.version = version
+
+    def fetch_month(self, year, month):
+        """Load the due rows of one month. Runs on a worker thread."""
+        start = year * 10000 + month * 100
+        return self.db.get_due(self.user_id, start + 1, start + 31)
+
+    def show_month(self):
+        year, month = self.year, self.month
+        self.month_label.config(text=f"{calendar.month_name[month]} {year}")
+        self.check_version()
+        if (year, month) in self.months:
+            log_debug(self.user_id, "Agenda for %s-%02d served from prefetch", year, month)
+            self.render_month(year, month, self.months[(year, month)])
+        else:
+            self.executor.submit(self.fetch_month, year, month, key="agenda",
+                                 callback=lambda rows: self.on_month(year, month, rows),
+                                 errback=lambda e: log_error(self.user_id, f"Error loading agenda: {str(e)}"))
+        self.prefetch(year, month)
+
+    def prefetch(self, year, month):
+        for offset in (-1, 1):
+            index = year * 12 + month - 1 + offset
+            neighbour = (index // 12, index % 12 + 1)
+            if neighbour not in self.months:
+                self.executor.submit(self.fetch_month, *neighbour, key=f"agenda-prefetch{offset}",
+                                     callback=lambda rows, neighbour=neighbour: self.store(neighbour, rows))
+
+    def store(self, month, rows):
+        self.check_version()
+        self.months[month] = rows
+
+    def on_month(self, year, month, rows):
+        self.store((year, month), rows)
+        if (year, month) == (self.year, self.month):
+            self.render_month(year, month, rows)
+
+    def render_month(self, year, month, rows):
+        by_day = {}
+        for due_key, type, category, amount, recurrence, period in rows:
+            by_day.setdefault(due_key % 100, []).append(category)
+        first_weekday, days = calendar.monthrange(year, month)
+        today = datetime.now()
+        for index, cell in enumerate(self.cells):
+            day = index - first_weekday + 1
+            if 1 <= day <= days:
+                due = by_day.get(day, [])
+                lines = [str(day)] + due[:2] + ([f"+{len(due) - 2} more"] if len(due) > 2 else [])
+                is_today = (year, month, day) == (today.year, today.month, today.day)
+                cell.config(text="\n".join(lines), state=tk.NORMAL,
+                            background="#fff3c4" if due else "#ffffff",
+                            font=("Arial", 8, "bold") if is_today else ("Arial", 8))
+            else:
+                cell.config(text="", state=tk.DISABLED, background="#f0f0f0", font=("Arial", 8))
+
+        self.tree.delete(*self.tree.get_children())
+        for due_key, type, category, amount, recurrence, period in rows:
+            date = datetime.strptime(str(due_key), "%Y%m%d").strftime("%b %d %Y")
+            self.tree.insert("", "end", values=(date, type, category, f"KSh {amount:,}", recurrence))
+        self.total_label.config(text=f"{len(rows)} due date(s), {len({(row[1], row[2], row[5]) for row in rows})} plan(s)")
+        log_info(self.user_id, f"Rendered agenda for {year}-{month:02d}: {len(rows)} due dates")
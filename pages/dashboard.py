@@ -1,20 +1,24 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from utils.database import Database
+from utils.database import Database, date_key
 from utils.logging import log_info, log_debug, log_error
 from styles import apply_styles
-from datetime import datetime
+from datetime import datetime, timedelta
 from utils.ui_helpers import create_greeting_label, create_navigation_bar
+from utils.executor import QueryExecutor
+from utils.charts import PieChart, BarChart
+
+UPCOMING_DAYS = 7
 
 class DashboardPage(tk.Frame):
-    def __init__(self, parent, switch_page_callback, user_id):
+    def __init__(self, parent, switch_page_callback, user_id, db=None, executor=None):
         super().__init__(parent)
         self.switch_page_callback = switch_page_callback
         self.user_id = user_id
-        self.db = Database()
+        self.db = db or Database()
+        self.executor = executor or QueryExecutor(self)
         self.trans_visible = True  # Track visibility of transactions
+        self.content_cache = {}  # period -> (cache key, fetched data)
         apply_styles()
         self.init_ui()
 
@@ -47,20 +51,18 @@ class DashboardPage(tk.Frame):
         totals_frame.grid(row=2, column=0, sticky="ew", padx=10, pady=5)
         self.totals_label = ttk.Label(totals_frame, text="Totals: Calculating...")
         self.totals_label.pack()
-
-        chart_frame = ttk.Frame(self)
-        chart_frame.grid(row=3, column=0, sticky="nsew", padx=10, pady=5)
-        chart_frame.grid_columnconfigure(0, weight=1)
-        chart_frame.grid_columnconfigure(1, weight=1)
-        chart_frame.grid_rowconfigure(0, weight=1)
-
-        self.fig_pie, ax_pie = plt.subplots(figsize=(4, 2))
-        self.canvas_pie = FigureCanvasTkAgg(self.fig_pie, master=chart_frame)
-        self.canvas_pie.get_tk_widget().grid(row=0, column=0, sticky="nsew", padx=5)
-
-        self.fig_bar, ax_bar = plt.subplots(figsize=(4, 2))
-        self.canvas_bar = FigureCanvasTkAgg(self.fig_bar, master=chart_frame)
-        self.canvas_bar.get_tk_widget().grid(row=0, column=1, sticky="nsew", padx=5)
+        self.burn_label = ttk.Label(totals_frame, text="")
+        self.burn_label.pack()
+        self.upcoming_label = ttk.Label(totals_frame, text="")
+        self.upcoming_label.pack()
+
+        self.chart_frame = ttk.Frame(self)
+        self.chart_frame.grid(row=3, column=0, sticky="nsew", padx=10, pady=5)
+        self.chart_frame.grid_columnconfigure(0, weight=1)
+        self.chart_frame.grid_columnconfigure(1, weight=1)
+        self.chart_frame.grid_rowconfigure(0, weight=1)
+        self.pie_chart = None  # built by create_charts when the first data arrives
+        self.bar_chart = None
 
         self.trans_frame = ttk.Frame(self)
         self.trans_frame.grid(row=4, column=0, sticky="nsew", padx=10, pady=5)
@@ -92,7 +94,7 @@ class DashboardPage(tk.Frame):
 
     def is_planning_enabled(self):
         enabled = self.db.is_planning_enabled(self.user_id)
-        log_debug(self.user_id, f"Checked planning enabled: {enabled}")
+        log_debug(self.user_id, "Checked planning enabled: %s", enabled)
         return enabled
 
     def toggle_transactions(self):
@@ -106,40 +108,92 @@ class DashboardPage(tk.Frame):
         log_info(self.user_id, f"Transactions visibility toggled to: {self.trans_visible}")
 
     def update_content(self, *args):
+        period = self.period_var.get()
+        # Today's date is part of the key because the periods and trend windows move with it
+        key = (self.user_id, period, datetime.now().date(), self.db.data_version(self.user_id))
+        cached = self.content_cache.get(period)
+        if cached and cached[0] == key:
+            log_debug(self.user_id, "Dashboard data for %s unchanged, skipping queries", period)
+            self.render_content(period, *cached[1], key=key)
+            return
+        self.executor.submit(self.fetch_content, period, key="dashboard",
+                             callback=lambda data: self.on_content(period, key, data),
+                             errback=self.show_update_error)
+
+    def on_content(self, period, key, data):
+        self.content_cache[period] = (key, data)
+        self.render_content(period, *data, key=key)
+
+    def fetch_content(self, period):
+        """Load the summary, trend, recent, budget and upcoming due rows for a period. Runs on a worker thread."""
+        summary = self.db.summarize(self.user_id, period)
+        if period == "Day":
+            trends = self.db.get_daily_trends(self.user_id)
+        elif period == "Week":
+            trends = self.db.get_weekly_trends(self.user_id)
+        elif period == "Month":
+            trends = self.db.get_monthly_trends(self.user_id)
+        else:
+            trends = self.db.get_yearly_trends(self.user_id)
+        recent = self.db.get_transactions(self.user_id, period, limit=5)
+        today = datetime.now()
+        if period == "Year":
+            variance = self.db.get_variance(self.user_id, today.year)
+        else:
+            variance = self.db.get_variance(self.user_id, today.year, month=today.month)
+        upcoming = self.db.get_due(self.user_id, date_key(today), date_key(today + timedelta(days=UPCOMING_DAYS - 1)))
+        return summary, trends, recent, variance, upcoming
+
+    def show_update_error(self, e):
+        log_error(self.user_id, f"Error updating dashboard content: {str(e)}")
+        messagebox.showerror("Error", f"Failed to update dashboard: {str(e)}")
+
+    def create_charts(self):
+        self.pie_chart = PieChart(self.chart_frame)
+        self.pie_chart.widget().grid(row=0, column=0, sticky="nsew", padx=5)
+        self.bar_chart = BarChart(self.chart_frame, ylabel="Balance (KSh)")
+        self.bar_chart.widget().grid(row=0, column=1, sticky="nsew", padx=5)
+
+    def render_burn(self, period, variance):
+        """Show how much of this month's (or year's) planned spending is used up."""
+        label = str(datetime.now().year) if period == "Year" else datetime.now().strftime("%B %Y")
+        planned = sum(row[2] for row in variance if row[0] == "Expenses")
+        spent = sum(row[3] for row in variance if row[0] == "Expenses")
+        if not planned:
+            self.burn_label.config(text=f"Budget ({label}): no expenses planned")
+            return
+        over = sorted((row for row in variance if row[0] == "Expenses" and row[3] > row[2]),
+                      key=lambda row: row[3] - row[2], reverse=True)[:3]
+        text = f"Budget ({label}): KSh {spent:,} of KSh {planned:,} spent ({spent * 100 // planned}%)"
+        if over:
+            text += "  Over plan: " + ", ".join(f"{row[1]} +KSh {row[3] - row[2]:,}" for row in over)
+        self.burn_label.config(text=text)
+
+    def render_upcoming(self, upcoming):
+        """List the plans falling due in the next UPCOMING_DAYS days."""
+        if not upcoming:
+            self.upcoming_label.config(text=f"Due in the next {UPCOMING_DAYS} days: nothing planned")
+            return
+        items = [f"{category} {datetime.strptime(str(due_key), '%Y%m%d').strftime('%b %d')}"
+                 for due_key, type, category, amount, recurrence, period in upcoming[:5]]
+        more = f" and {len(upcoming) - 5} more" if len(upcoming) > 5 else ""
+        self.upcoming_label.config(text=f"Due in the next {UPCOMING_DAYS} days: {', '.join(items)}{more}")
+
+    def render_content(self, period, summary, trends, recent, variance, upcoming, key=None):
         try:
-            period = self.period_var.get()
-            transactions = self.db.get_transactions(self.user_id, period)
-            cash_balance, mpesa_balance, income_total, expenses_total, savings_total = 0, 0, 0, 0, 0
-            category_totals = {"Income": {}, "Expenses": {}, "Savings": {}}
-
-            for trans in transactions:
-                amount, mode, type, category = trans[4], trans[5], trans[2], trans[3]
-                if type == "Income":
-                    income_total += amount
-                    category_totals["Income"][category] = category_totals["Income"].get(category, 0) + amount
-                    if mode == "Cash":
-                        cash_balance += amount
-                    else:
-                        mpesa_balance += amount
-                elif type == "Expenses":
-                    expenses_total += amount
-                    category_totals["Expenses"][category] = category_totals["Expenses"].get(category, 0) + amount
-                    if mode == "Cash":
-                        cash_balance -= amount
-                    else:
-                        mpesa_balance -= amount
-                else:
-                    savings_total += amount
-                    category_totals["Savings"][category] = category_totals["Savings"].get(category, 0) + amount
-                    if mode == "Cash":
-                        cash_balance -= amount
-                    else:
-                        mpesa_balance -= amount
+            cash_balance = summary["balances"]["Cash"]
+            mpesa_balance = summary["balances"]["Mpesa"]
+            income_total = summary["totals"]["Income"]
+            expenses_total = summary["totals"]["Expenses"]
+            savings_total = summary["totals"]["Savings"]
+            category_totals = summary["categories"]
             self.balance_label.config(text=f"Balance: Mpesa KSh {mpesa_balance:,}  Cash KSh {cash_balance:,}  Total KSh {mpesa_balance + cash_balance:,}")
             self.totals_label.config(text=f"Income: KSh {income_total:,}  Expenses: KSh {expenses_total:,}  Savings: KSh {savings_total:,}")
+            self.render_burn(period, variance)
+            self.render_upcoming(upcoming)
+            if self.pie_chart is None:
+                self.create_charts()
 
-            self.fig_pie.clear()
-            ax = self.fig_pie.add_subplot(111)
             if period == "Day":
                 labels = []
                 sizes = []
@@ -151,58 +205,32 @@ class DashboardPage(tk.Frame):
                             labels.append(f"{type}: {category}")
                             sizes.append(amount)
                             colors.append(type_colors[type])
-                sizes = [s if s > 0 else 0.01 for s in sizes]
-                ax.pie(sizes, labels=labels, colors=colors, autopct="%1.1f%%", startangle=90)
+                self.pie_chart.update(key, labels, sizes, colors, title=f"{period} Breakdown")
             else:
                 labels = ["Income", "Expenses", "Savings"]
                 sizes = [income_total, expenses_total, savings_total]
-                sizes = [s if s > 0 else 0.01 for s in sizes]
-                ax.pie(sizes, labels=labels, autopct="%1.1f%%", startangle=90)
-            ax.axis("equal")
-            ax.set_title(f"{period} Breakdown")
-            self.canvas_pie.draw()
+                self.pie_chart.update(key, labels, sizes, title=f"{period} Breakdown")
 
+            x_axis = [t[0] for t in trends]
+            balances = [t[4] for t in trends]
             if period == "Day":
-                trends = self.db.get_daily_trends(self.user_id)
-                x_axis = [t[0] for t in trends]
-                balances = [t[4] for t in trends]
-                x_label = "Hour"
+                x_label = "Day"
                 title = "Daily Balance Trends"
             elif period == "Week":
-                trends = self.db.get_weekly_trends(self.user_id)
-                x_axis = [t[0] for t in trends]
-                balances = [t[4] for t in trends]
-                x_label = "Day"
+                x_label = "Week"
                 title = "Weekly Balance Trends"
             elif period == "Month":
-                trends = self.db.get_monthly_trends(self.user_id)
-                x_axis = [t[0] for t in trends]
-                balances = [t[4] for t in trends]
                 x_label = "Month"
                 title = "Monthly Balance Trends"
             else:  # Year
-                trends = self.db.get_yearly_trends(self.user_id)
-                x_axis = [t[0] for t in trends]
-                balances = [t[4] for t in trends]
                 x_label = "Year"
                 title = "Yearly Balance Trends"
-
-            self.fig_bar.clear()
-            ax = self.fig_bar.add_subplot(111)
-            ax.bar(x_axis, balances, color="blue")
-            ax.set_xlabel(x_label)
-            ax.set_ylabel("Balance (KSh)")
-            ax.set_title(title)
-            self.fig_bar.tight_layout()
-            self.canvas_bar.draw()
+            self.bar_chart.update(key, x_axis, balances, xlabel=x_label, title=title)
 
             self.tree.delete(*self.tree.get_children())
-            # Use get_transactions with period filter and limit to 5 for recent transactions
-            recent = self.db.get_transactions(self.user_id, period, category="All", mode="All", start_date=None, end_date=None)[:5]
             for trans in recent:
                 date, type, category, amount, mode, details = trans[1:7]
                 self.tree.insert("", "end", values=(date, type, category, f"KSh {amount:,}", mode, details))
             log_info(self.user_id, f"Updated Dashboard for {period}: {len(recent)} recent transactions")
         except Exception as e:
-            log_error(self.user_id, f"Error updating dashboard content: {str(e)}")
-            messagebox.showerror("Error", f"Failed to update dashboard: {str(e)}")
+            self.show_update_error(e)
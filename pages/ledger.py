@@ -0,0 +1,123 @@
+from tkinter import ttk
+from utils.logging import log_debug, log_error
+
+class LedgerView(ttk.Frame):
+    """Transaction table that only keeps the visible window of rows in the Treeview.
+
+    Rows are fetched from Database.get_transactions with keyset pagination as the
+    user scrolls, so a filter matching 100k transactions costs a page at a time.
+    Pages are fetched on the executor's workers and drawn when they arrive.
+    """
+    def __init__(self, parent, db, executor, user_id, columns, format_row, overscan=20):
+        super().__init__(parent)
+        self.db = db
+        self.executor = executor
+        self.user_id = user_id
+        self.format_row = format_row
+        self.overscan = overscan
+        self.filter_args = ("All", None, None)
+        self.total = 0
+        self.offset = 0
+        self.visible_rows = 20
+        self.window_start = 0
+        self.window = []  # cached rows starting at window_start
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self.tree = ttk.Treeview(self, columns=columns, show="headings")
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll_to(self.offset + (-3 if e.delta > 0 else 3)))
+        self.tree.bind("<Button-4>", lambda e: self.scroll_to(self.offset - 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_to(self.offset + 3))
+        self.tree.bind("<Prior>", lambda e: self.scroll_to(self.offset - self.visible_rows))
+        self.tree.bind("<Next>", lambda e: self.scroll_to(self.offset + self.visible_rows))
+
+    def load(self, date_filter, start_date=None, end_date=None, total=None):
+        """Show the transactions matching a filter, starting from the newest."""
+        self.filter_args = (date_filter, start_date, end_date)
+        self.window = []
+        self.window_start = 0
+        self.offset = 0
+        if total is None:
+            self.executor.submit(self.db.summarize, self.user_id, *self.filter_args, key="ledger-total",
+                                 callback=lambda summary, args=self.filter_args: self.on_total(args, summary["count"]),
+                                 errback=lambda e: log_error(self.user_id, f"Error counting ledger rows: {str(e)}"))
+        else:
+            self.on_total(self.filter_args, total)
+
+    def on_total(self, filter_args, total):
+        if filter_args == self.filter_args:
+            self.total = total
+            self.render()
+
+    def refresh(self):
+        """Re-fetch the current window, e.g. after a row was added or deleted."""
+        self.window = []
+        self.render()
+
+    def on_resize(self, event):
+        rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible_rows = max(1, (event.height - rowheight) // rowheight)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render()
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * self.total))
+        elif unit == "pages":
+            self.scroll_to(self.offset + int(value) * self.visible_rows)
+        else:
+            self.scroll_to(self.offset + int(value))
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.total - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+        return "break"
+
+    def fetch_window(self, filter_args, start, after, limit):
+        """Fetch limit rows from row start, seeking to it first if after is unknown. Runs on a worker thread."""
+        if start > 0 and after is None:
+            after = self.db.get_transaction_cursor(self.user_id, *filter_args, offset=start - 1)
+        return self.db.get_transactions(self.user_id, *filter_args, limit=limit, after=after)
+
+    def render(self):
+        """Draw the visible rows, first fetching a page plus overscan in the background if they are not cached."""
+        end = min(self.offset + self.visible_rows, self.total)
+        if self.window_start <= self.offset and end <= self.window_start + len(self.window):
+            self.draw()
+            return
+        start = max(0, self.offset - self.overscan)
+        after = None
+        if self.window_start < start <= self.window_start + len(self.window):
+            previous = self.window[start - self.window_start - 1]  # sequential scroll: reuse a cached key
+            after = (previous[-1], previous[0])
+        limit = self.visible_rows + 2 * self.overscan
+        self.executor.submit(self.fetch_window, self.filter_args, start, after, limit, key="ledger",
+                             callback=lambda rows, args=self.filter_args: self.on_window(args, start, rows),
+                             errback=lambda e: log_error(self.user_id, f"Error loading ledger rows: {str(e)}"))
+
+    def on_window(self, filter_args, start, rows):
+        if filter_args != self.filter_args:
+            return
+        self.window = rows
+        self.window_start = start
+        log_debug(self.user_id, "Fetched ledger rows %s-%s of %s", start, start + len(rows), self.total)
+        self.draw()
+
+    def draw(self):
+        self.tree.delete(*self.tree.get_children())
+        first = self.offset - self.window_start
+        for row in self.window[first:first + self.visible_rows]:
+            values, tags = self.format_row(row)
+            self.tree.insert("", "end", iid=str(row[0]), values=values, tags=tags)
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, min(1.0, (self.offset + self.visible_rows) / self.total))
+        else:
+            self.scrollbar.set(0, 1)
@@ -6,11 +6,11 @@ from styles import apply_styles
 import re
 
 class LoginPage(tk.Frame):
-    def __init__(self, parent, switch_page_callback, set_user_callback):
+    def __init__(self, parent, switch_page_callback, set_user_callback, db=None):
         super().__init__(parent)
         self.switch_page_callback = switch_page_callback
         self.set_user_callback = set_user_callback
-        self.db = Database()
+        self.db = db or Database()
         apply_styles()
         self.init_ui()
 
@@ -2,18 +2,20 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import calendar
 from datetime import datetime
-import re
-import json
 from utils.database import Database
 from utils.logging import log_info, log_error, log_debug
 from styles import apply_styles
+from utils.executor import QueryExecutor
+from utils import recurrence as recurrence_rules
+from pages.agenda import AgendaWindow
 
 class PlanningPage(tk.Frame):
-    def __init__(self, parent, switch_page_callback, user_id):
+    def __init__(self, parent, switch_page_callback, user_id, db=None, executor=None):
         super().__init__(parent)
         self.switch_page_callback = switch_page_callback
         self.user_id = user_id
-        self.db = Database()
+        self.db = db or Database()
+        self.executor = executor or QueryExecutor(self)
         self.current_year = datetime.now().year  # Class-level current_year
         apply_styles()
         self.tooltip = None
@@ -21,8 +23,6 @@ class PlanningPage(tk.Frame):
             'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
             'friday': 4, 'saturday': 5, 'sunday': 6
         }
-        self.ordinal_map = {'1st': 1, 'first': 1, '2nd': 2, 'second': 2, '3rd': 3, 'third': 3,
-                           '4th': 4, 'fourth': 4, '5th': 5, 'fifth': 5}
         self.init_ui()
 
     def init_ui(self):
@@ -35,11 +35,7 @@ class PlanningPage(tk.Frame):
 
         # Year dropdown
         self.year_var = tk.StringVar(value=str(self.current_year))
-        years = [str(self.current_year)]
-        next_year = self.current_year
-        while self.db.has_december_plan(self.user_id, next_year):
-            years.append(str(next_year + 1))
-            next_year += 1
+        years = [str(year) for year in self.get_years()]
         ttk.Label(header_frame, text="Year:").pack(side=tk.LEFT, padx=3)
         self.year_combo = ttk.Combobox(header_frame, textvariable=self.year_var, values=years,
                                       state="readonly", width=10)
@@ -48,7 +44,8 @@ class PlanningPage(tk.Frame):
         # Month dropdown
         self.month_var = tk.StringVar(value=datetime.now().strftime("%B"))
         months = ["January", "February", "March", "April", "May", "June",
-                  "July", "August", "September", "October", "November", "December", "Total Year"]
+                  "July", "August", "September", "October", "November", "December", "Total Year",
+                  "Q1", "Q2", "Q3", "Q4"]
         ttk.Label(header_frame, text="Month:").pack(side=tk.LEFT, padx=3)
         ttk.Combobox(header_frame, textvariable=self.month_var, values=months,
                     state="readonly", width=15).pack(side=tk.LEFT, padx=3)
@@ -63,22 +60,25 @@ class PlanningPage(tk.Frame):
         ttk.Button(control_frame, text="New Plan", style="Success.TButton",
                   command=self.open_new_plan).pack(side=tk.LEFT, padx=3)
         ttk.Button(control_frame, text="Copy Plan", command=self.copy_plan).pack(side=tk.LEFT, padx=3)
+        ttk.Button(control_frame, text="Calendar", command=self.open_agenda).pack(side=tk.LEFT, padx=3)
 
         # Table frame
         table_frame = ttk.Frame(self)
         table_frame.grid(row=2, column=0, sticky="nsew", padx=5, pady=2)
         table_frame.grid_columnconfigure(0, weight=1)
         table_frame.grid_rowconfigure(0, weight=1)
-        self.tree = ttk.Treeview(table_frame, columns=("Category", "Amount", "Recurrence", "Due"),
+        self.tree = ttk.Treeview(table_frame, columns=("Category", "Amount", "Actual", "Recurrence", "Due"),
                                 show="tree headings", height=15)
         self.tree.heading("#0", text="Type")
         self.tree.heading("Category", text="Category", anchor="center")
         self.tree.heading("Amount", text="Amount (KSh)", anchor="center")
+        self.tree.heading("Actual", text="Actual (KSh)", anchor="center")
         self.tree.heading("Recurrence", text="Recurrence", anchor="center")
         self.tree.heading("Due", text="Due", anchor="center")
         self.tree.column("#0", width=100, anchor="center")
         self.tree.column("Category", width=150, anchor="center")
         self.tree.column("Amount", width=150, anchor="center")
+        self.tree.column("Actual", width=150, anchor="center")
         self.tree.column("Recurrence", width=100, anchor="center")
         self.tree.column("Due", width=100, anchor="center")
         self.tree.grid(row=0, column=0, sticky="nsew")
@@ -86,6 +86,7 @@ class PlanningPage(tk.Frame):
         scrollbar.grid(row=0, column=1, sticky="ns")
         self.tree.configure(yscrollcommand=scrollbar.set)
         self.tree.tag_configure("type", font=("Arial", 10, "bold"))
+        self.tree.tag_configure("over", foreground="red")
         self.tree.bind("<Button-3>", self.show_tooltip)
         style = ttk.Style()
         style.configure("Treeview", rowheight=20)
@@ -104,20 +105,29 @@ class PlanningPage(tk.Frame):
         self.update_content()
 
     def update_content(self):
-        self.tree.delete(*self.tree.get_children())
         period = f"{self.month_var.get()} {self.year_var.get()}" if self.month_var.get() != "Total Year" else self.year_var.get()
-        
-        # Handle Total Year case
-        if self.month_var.get() == "Total Year":
-            year = int(self.year_var.get())
-            months = ["January", "February", "March", "April", "May", "June",
-                      "July", "August", "September", "October", "November", "December"]
-            plans = []
-            for month in months:
-                month_period = f"{month} {year}"
-                plans.extend(self.db.get_plans(self.user_id, month_period))
+        self.executor.submit(self.fetch_plans, self.month_var.get(), self.year_var.get(), key="planning",
+                             callback=lambda data: self.render_plans(period, *data))
+
+    def fetch_plans(self, month, year):
+        """Load the plans and plan-vs-actual rows for the selected month, quarter or whole year. Runs on a worker thread."""
+        if month == "Total Year":
+            plans = self.db.get_plan_totals(self.user_id, int(year))
+            variance = self.db.get_variance(self.user_id, int(year))
+        elif month in ("Q1", "Q2", "Q3", "Q4"):
+            plans = self.db.get_plan_totals(self.user_id, int(year), quarter=int(month[1]))
+            variance = self.db.get_variance(self.user_id, int(year), quarter=int(month[1]))
         else:
-            plans = self.db.get_plans(self.user_id, period)
+            plans = self.db.get_plans(self.user_id, f"{month} {year}")
+            variance = self.db.get_variance(self.user_id, int(year), month=datetime.strptime(month, "%B").month)
+        return plans, variance
+
+    def render_plans(self, period, plans, variance):
+        self.tree.delete(*self.tree.get_children())
+        actuals = {(type, category): actual for type, category, planned, actual in variance}
+        type_actuals = {"Income": 0, "Expenses": 0, "Savings": 0}
+        for (type, category), actual in actuals.items():
+            type_actuals[type] += actual
 
         # Aggregate duplicate categories
         aggregated_plans = {}
@@ -146,31 +156,35 @@ class PlanningPage(tk.Frame):
 
         # Insert into tree
         income_total, expenses_total, savings_total = 0, 0, 0
-        income_node = self.tree.insert("", "end", text="Income", values=("", f"KSh {income_total:,}", "", ""),
+        income_node = self.tree.insert("", "end", text="Income", values=("", f"KSh {income_total:,}", "", "", ""),
                                      tags=("type",), open=True)
-        expenses_node = self.tree.insert("", "end", text="Expenses", values=("", f"KSh {expenses_total:,}", "", ""),
+        expenses_node = self.tree.insert("", "end", text="Expenses", values=("", f"KSh {expenses_total:,}", "", "", ""),
                                        tags=("type",), open=True)
-        savings_node = self.tree.insert("", "end", text="Savings", values=("", f"KSh {savings_total:,}", "", ""),
+        savings_node = self.tree.insert("", "end", text="Savings", values=("", f"KSh {savings_total:,}", "", "", ""),
                                       tags=("type",), open=True)
 
         for category, amount, recurrence, due in income_plans:
-            self.tree.insert(income_node, "end", values=(category, f"KSh {amount:,}", recurrence, due),
+            actual = actuals.get(("Income", category), 0)
+            self.tree.insert(income_node, "end", values=(category, f"KSh {amount:,}", f"KSh {actual:,}", recurrence, due),
                            tags=("Income", category))
             income_total += amount
 
         for category, amount, recurrence, due in expenses_plans:
-            self.tree.insert(expenses_node, "end", values=(category, f"KSh {amount:,}", recurrence, due),
-                           tags=("Expenses", category))
+            actual = actuals.get(("Expenses", category), 0)
+            tags = ("Expenses", category, "over") if actual > amount else ("Expenses", category)
+            self.tree.insert(expenses_node, "end", values=(category, f"KSh {amount:,}", f"KSh {actual:,}", recurrence, due),
+                           tags=tags)
             expenses_total += amount
 
         for category, amount, recurrence, due in savings_plans:
-            self.tree.insert(savings_node, "end", values=(category, f"KSh {amount:,}", recurrence, due),
+            actual = actuals.get(("Savings", category), 0)
+            self.tree.insert(savings_node, "end", values=(category, f"KSh {amount:,}", f"KSh {actual:,}", recurrence, due),
                            tags=("Savings", category))
             savings_total += amount
 
-        self.tree.item(income_node, values=("", f"KSh {income_total:,}", "", ""))
-        self.tree.item(expenses_node, values=("", f"KSh {expenses_total:,}", "", ""))
-        self.tree.item(savings_node, values=("", f"KSh {savings_total:,}", "", ""))
+        self.tree.item(income_node, values=("", f"KSh {income_total:,}", f"KSh {type_actuals['Income']:,}", "", ""))
+        self.tree.item(expenses_node, values=("", f"KSh {expenses_total:,}", f"KSh {type_actuals['Expenses']:,}", "", ""))
+        self.tree.item(savings_node, values=("", f"KSh {savings_total:,}", f"KSh {type_actuals['Savings']:,}", "", ""))
 
         balance = income_total - expenses_total - savings_total
         if balance == 0:
@@ -192,7 +206,7 @@ class PlanningPage(tk.Frame):
         tags = self.tree.item(item, "tags")
         if "type" in tags:
             return
-        type, category = tags
+        type, category = tags[:2]
 
         if self.tooltip:
             self.tooltip.destroy()
@@ -207,16 +221,20 @@ class PlanningPage(tk.Frame):
                  command=lambda: self.delete_category(type, category)).pack()
 
         self.tooltip.bind("<Leave>", lambda e: self.tooltip.destroy())
-        log_debug(self.user_id, f"Showed tooltip for category {type}/{category}")
+        log_debug(self.user_id, "Showed tooltip for category %s/%s", type, category)
 
     def delete_category(self, type, category):
         if messagebox.askyesno("Confirm", f"Delete category {type}/{category}? This action is irreversible."):
-            if self.db.delete_category(self.user_id, type, category):
-                self.update_content()
-                log_info(self.user_id, f"Deleted category: {type}/{category}")
-            else:
-                messagebox.showerror("Error", "Cannot delete category: used in transactions")
-                log_error(self.user_id, f"Failed to delete category {type}/{category}")
+            self.executor.submit(self.db.delete_category, self.user_id, type, category,
+                                 callback=lambda deleted: self.on_category_deleted(deleted, type, category))
+
+    def on_category_deleted(self, deleted, type, category):
+        if deleted:
+            self.update_content()
+            log_info(self.user_id, f"Deleted category: {type}/{category}")
+        else:
+            messagebox.showerror("Error", "Cannot delete category: used in transactions")
+            log_error(self.user_id, f"Failed to delete category {type}/{category}")
 
     def get_days_in_month(self, month, year):
         """Return the number of days in the given month and year."""
@@ -225,7 +243,7 @@ class PlanningPage(tk.Frame):
                         "July", "August", "September", "October", "November", "December"].index(month) + 1
             if month == "February":
                 days = 29 if calendar.isleap(year) else 28
-                log_debug(self.user_id, f"Calculating days for February {year}: {days}")
+                log_debug(self.user_id, "Calculating days for February %s: %s", year, days)
                 return days
             return [31, None, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month_idx - 1]
         except ValueError:
@@ -240,82 +258,10 @@ class PlanningPage(tk.Frame):
             suffix = {1: "st", 2: "nd", 3: "rd"}.get(day % 10, "th")
         return f"{day}{suffix}"
 
-    def parse_custom_input(self, input_text):
-        """Parse and validate custom recurrence input using regex."""
-        patterns = [
-            {
-                "type": "interval",
-                "regex": r"^every\s+(\d+)\s+days?(?:\s+from\s+(\d+))?$",
-                "validate": lambda m: (
-                    1 <= int(m.group(1)) <= 31 and 
-                    (m.group(2) is None or 1 <= int(m.group(2)) <= 31),
-                    "Invalid interval or start day. Use 'every N days [from M]' where N and M are 1–31."
-                ),
-                "details": lambda m: {"type": "interval", "interval": int(m.group(1)), "start_day": int(m.group(2)) if m.group(2) else 1}
-            },
-            {
-                "type": "multiple_days",
-                "regex": r"^on\s+days?\s+(\d+(?:\s*,\s*\d+)*)$",
-                "validate": lambda m: (
-                    all(1 <= int(day.strip()) <= 31 for day in m.group(1).split(',')),
-                    "Invalid days. Use 'on days 1, 15, 25' with days 1–31."
-                ),
-                "details": lambda m: {"type": "multiple_days", "days": [int(day.strip()) for day in m.group(1).split(',')]}
-            },
-            {
-                "type": "nth_weekday",
-                "regex": r"^(1st|first|2nd|second|3rd|third|4th|fourth|5th|fifth)\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)$",
-                "validate": lambda m: True,
-                "details": lambda m: {"type": "nth_weekday", "weekday": m.group(2), "nth": self.ordinal_map[m.group(1)]}
-            },
-            {
-                "type": "last_weekday",
-                "regex": r"^last\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)$",
-                "validate": lambda m: True,
-                "details": lambda m: {"type": "last_weekday", "weekday": m.group(1)}
-            },
-            {
-                "type": "nth_week",
-                "regex": r"^every\s+(\d+)\s+weeks?\s+on\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)(?:\s+from\s+(\d+))?$",
-                "validate": lambda m: (
-                    1 <= int(m.group(1)) <= 4 and 
-                    (m.group(3) is None or 1 <= int(m.group(3)) <= 31),
-                    "Invalid week interval or start day. Use 'every N weeks on weekday [from M]' where N is 1–4 and M is 1–31."
-                ),
-                "details": lambda m: {
-                    "type": "nth_week",
-                    "weekday": m.group(2),
-                    "interval": int(m.group(1)),
-                    "start_day": int(m.group(3)) if m.group(3) else 1
-                }
-            },
-            {
-                "type": "weekday_combinations",
-                "regex": r"^(?:(1st|first|2nd|second|3rd|third|4th|fourth|5th|fifth)\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)(?:\s+and\s+)?)+$",
-                "validate": lambda m: (
-                    len(re.findall(r"(1st|first|2nd|second|3rd|third|4th|fourth|5th|fifth)\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)", input_text)) >= 2,
-                    "Invalid weekday combinations. Use '1st and 3rd Monday' or similar with at least two instances."
-                ),
-                "details": lambda m: {
-                    "type": "weekday_combinations",
-                    "instances": [
-                        {"weekday": w, "nth": self.ordinal_map[o]}
-                        for o, w in re.findall(r"(1st|first|2nd|second|3rd|third|4th|fourth|5th|fifth)\s+(monday|tuesday|wednesday|thursday|friday|saturday|sunday)", input_text)
-                    ]
-                }
-            }
-        ]
-        
-        for pattern in patterns:
-            match = re.match(pattern["regex"], input_text.lower(), re.IGNORECASE)
-            if match:
-                is_valid, error_message = pattern["validate"](match)
-                if is_valid:
-                    return pattern["details"](match), None
-                return None, error_message
-        return None, "Invalid custom recurrence. Use formats like 'every 5 days from 3', 'on days 1, 15', '2nd Tuesday', 'last Friday', 'every 2 weeks on Monday from 4', or '1st and 3rd Monday'."
-
     def open_new_plan(self, type=None, category=None):
+        if self.month_var.get() in ("Q1", "Q2", "Q3", "Q4"):
+            messagebox.showinfo("Quarter View", "Select a month or Total Year to add or edit plans")
+            return
         popup = tk.Toplevel(self)
         popup.title("Edit Plan" if type and category else "New Plan")
         popup.geometry("300x400")
@@ -343,7 +289,7 @@ class PlanningPage(tk.Frame):
 
         def update_categories(*args):
             categories = self.db.get_categories(self.user_id, type_var.get())
-            log_debug(self.user_id, f"Updating categories for type {type_var.get()}: {categories}")
+            log_debug(self.user_id, "Updating categories for type %s: %s", type_var.get(), categories)
             category_combo["values"] = sorted(categories) if categories else [""]
             if categories and not category_var.get():
                 category_var.set(categories[0])
@@ -393,7 +339,7 @@ class PlanningPage(tk.Frame):
                 days = 31
             else:
                 days = self.get_days_in_month(self.month_var.get(), int(self.year_var.get()))
-                log_debug(self.user_id, f"Updating due combo for {self.month_var.get()} {self.year_var.get()}: {days} days")
+                log_debug(self.user_id, "Updating due combo for %s %s: %s days", self.month_var.get(), self.year_var.get(), days)
                 due_combo["values"] = [self.get_ordinal_suffix(i) for i in range(1, days + 1)] + ["last"]
                 if due_var.get() not in due_combo["values"]:
                     due_var.set(due_combo["values"][0] if due_combo["values"] else "")
@@ -432,21 +378,8 @@ class PlanningPage(tk.Frame):
                 due_var.set(plan.get("due", ""))
                 if plan.get("custom_period"):
                     try:
-                        custom_details = json.loads(plan.get("custom_period"))
-                        if custom_details.get("type") == "interval":
-                            custom_var.set(f"every {custom_details['interval']} days from {custom_details['start_day']}")
-                        elif custom_details.get("type") == "multiple_days":
-                            custom_var.set(f"on days {', '.join(map(str, custom_details['days']))}")
-                        elif custom_details.get("type") == "nth_weekday":
-                            custom_var.set(f"{custom_details['nth']}th {custom_details['weekday']}")
-                        elif custom_details.get("type") == "last_weekday":
-                            custom_var.set(f"last {custom_details['weekday']}")
-                        elif custom_details.get("type") == "nth_week":
-                            custom_var.set(f"every {custom_details['interval']} weeks on {custom_details['weekday']} from {custom_details['start_day']}")
-                        elif custom_details.get("type") == "weekday_combinations":
-                            instances = [f"{inst['nth']}th {inst['weekday']}" for inst in custom_details['instances']]
-                            custom_var.set(" and ".join(instances))
-                    except json.JSONDecodeError:
+                        custom_var.set(recurrence_rules.describe(recurrence_rules.from_json(plan.get("custom_period"))))
+                    except ValueError:
                         custom_var.set(plan.get("custom_period", ""))
                 amount_var.set(str(plan.get("amount", "")))
                 if plan.get("recurrence") == "Daily" and plan.get("due"):
@@ -468,7 +401,7 @@ class PlanningPage(tk.Frame):
                 if recurrence == "Daily":
                     selected_days = [day for day, var in day_vars.items() if var.get()]
                     due = ",".join(selected_days) or "Mon,Tue,Wed,Thu,Fri,Sat,Sun"
-                    log_debug(self.user_id, f"Daily recurrence selected days: {due}")
+                    log_debug(self.user_id, "Daily recurrence selected days: %s", due)
                 elif recurrence == "Monthly":
                     if not due:
                         raise ValueError("Due date required for monthly recurrence")
@@ -480,33 +413,21 @@ class PlanningPage(tk.Frame):
                     custom_input = custom_var.get().strip()
                     if not custom_input:
                         raise ValueError("Custom recurrence details required")
-                    custom_details, error = self.parse_custom_input(custom_input)
+                    rule, error = recurrence_rules.parse(custom_input)
                     if error:
                         raise ValueError(error)
-                    custom_period = json.dumps(custom_details)
-                    log_debug(self.user_id, f"Parsed custom recurrence: {custom_period}")
+                    custom_period = recurrence_rules.to_json(rule)
+                    log_debug(self.user_id, "Parsed custom recurrence: %s", custom_period)
                 elif recurrence == "None":
                     due = ""
                     custom_period = None
 
                 period = f"{self.month_var.get()} {self.year_var.get()}" if self.month_var.get() != "Total Year" else self.year_var.get()
-                log_debug(self.user_id, f"Saving plan: period={period}, type={type_var.get()}, category={category_var.get()}, amount={amount}, recurrence={recurrence}, due={due}, custom_period={custom_period}")
+                log_debug(self.user_id, "Saving plan: period=%s, type=%s, category=%s, amount=%s, recurrence=%s, due=%s, custom_period=%s", period, type_var.get(), category_var.get(), amount, recurrence, due, custom_period)
                 
-                if self.db.add_plan(self.user_id, period, type_var.get(), category_var.get(),
-                                 amount, recurrence, due, custom_period):
-                    self.update_content()
-                    popup.destroy()
-                    log_info(self.user_id, f"Saved plan: {period}, {type_var.get()}/{category_var.get()}")
-                    if self.month_var.get() == "December":
-                        years = [str(self.current_year)]
-                        next_year = self.current_year
-                        while self.db.has_december_plan(self.user_id, next_year):
-                            years.append(str(next_year + 1))
-                            next_year += 1
-                        self.year_combo["values"] = years
-                else:
-                    messagebox.showerror("Error", "Failed to save plan")
-                    log_error(self.user_id, f"Failed to save plan: {period}, {type_var.get()}/{category_var.get()}")
+                self.executor.submit(self.db.add_plan, self.user_id, period, type_var.get(), category_var.get(),
+                                     amount, recurrence, due, custom_period,
+                                     callback=lambda added, plan=(period, type_var.get(), category_var.get()): on_saved(added, *plan))
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
                 log_error(self.user_id, f"Plan validation failed: {str(e)}")
@@ -514,9 +435,26 @@ class PlanningPage(tk.Frame):
                 messagebox.showerror("Error", f"Unexpected error: {str(e)}")
                 log_error(self.user_id, f"Unexpected error in save_plan: {str(e)}")
 
+        def on_saved(added, period, type, category):
+            if added:
+                self.update_content()
+                popup.destroy()
+                log_info(self.user_id, f"Saved plan: {period}, {type}/{category}")
+                if period.startswith("December"):
+                    self.year_combo["values"] = [str(year) for year in self.get_years()]
+            else:
+                messagebox.showerror("Error", "Failed to save plan")
+                log_error(self.user_id, f"Failed to save plan: {period}, {type}/{category}")
+
         ttk.Button(popup, text="Save", style="Success.TButton", command=save_plan).grid(row=row, column=0, columnspan=2, pady=5)
         update_due_ui()
 
+    def open_agenda(self):
+        """Show plan due dates by month, starting at the selected month (or January for year views)."""
+        month = self.month_var.get()
+        month = datetime.strptime(month, "%B").month if month in calendar.month_name[1:] else 1
+        AgendaWindow(self, self.db, self.executor, self.user_id, int(self.year_var.get()), month)
+
     def get_previous_month(self):
         months = ["January", "February", "March", "April", "May", "June",
                   "July", "August", "September", "October", "November", "December"]
@@ -530,7 +468,7 @@ class PlanningPage(tk.Frame):
     def copy_plan(self):
         popup = tk.Toplevel(self)
         popup.title("Copy Plan")
-        popup.geometry("300x200")
+        popup.geometry("300x280")
         popup.transient(self)
         popup.grab_set()
 
@@ -541,35 +479,59 @@ class PlanningPage(tk.Frame):
 
         ttk.Label(popup, text="To Period:").pack(pady=5)
         to_period_var = tk.StringVar()
-        ttk.Combobox(popup, textvariable=to_period_var, values=self.get_periods(),
-                    state="readonly").pack(pady=5)
+        to_period_combo = ttk.Combobox(popup, textvariable=to_period_var, values=self.get_periods(), state="readonly")
+        to_period_combo.pack(pady=5)
+        rest_of_year_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(popup, text="Rest of the year", variable=rest_of_year_var,
+                        command=lambda: to_period_combo.config(state="disabled" if rest_of_year_var.get() else "readonly")).pack(pady=2)
+
+        ttk.Label(popup, text="Existing Categories:").pack(pady=5)
+        policies = {"Skip": "skip", "Overwrite": "overwrite", "Add Amounts": "add"}
+        policy_var = tk.StringVar(value="Skip")
+        ttk.Combobox(popup, textvariable=policy_var, values=list(policies), state="readonly").pack(pady=5)
+
+        def target_periods():
+            if not rest_of_year_var.get():
+                return [to_period_var.get()] if to_period_var.get() else []
+            months = ["January", "February", "March", "April", "May", "June",
+                      "July", "August", "September", "October", "November", "December"]
+            month, year = from_period_var.get().split()
+            if month not in months:
+                return []
+            return [f"{later} {year}" for later in months[months.index(month) + 1:]]
 
         def save_copy():
-            if self.db.copy_plan(self.user_id, from_period_var.get(), to_period_var.get()):
-                self.month_var.set(to_period_var.get().split()[0])
-                self.year_var.set(to_period_var.get().split()[-1])
+            targets = target_periods()
+            if not targets:
+                messagebox.showerror("Error", "Choose a period to copy to")
+                return
+            self.executor.submit(self.db.copy_plan, self.user_id, from_period_var.get(), targets,
+                                 policies[policy_var.get()], callback=lambda copied: on_copied(copied, targets))
+
+        def on_copied(copied, targets):
+            if copied:
+                self.month_var.set(targets[0].split()[0])
+                self.year_var.set(targets[0].split()[-1])
                 self.update_content()
                 popup.destroy()
-                log_info(self.user_id, f"Copied plan from {from_period_var.get()} to {to_period_var.get()}")
-                if to_period_var.get().startswith("December"):
-                    years = [str(self.current_year)]
-                    next_year = self.current_year
-                    while self.db.has_december_plan(self.user_id, next_year):
-                        years.append(str(next_year + 1))
-                        next_year += 1
-                    self.year_combo["values"] = years
+                log_info(self.user_id, f"Copied plan from {from_period_var.get()} to {', '.join(targets)}")
+                if targets[-1].startswith("December"):
+                    self.year_combo["values"] = [str(year) for year in self.get_years()]
             else:
                 messagebox.showerror("Error", "Failed to copy plan")
-                log_error(self.user_id, f"Failed to copy plan from {from_period_var.get()} to {to_period_var.get()}")
+                log_error(self.user_id, f"Failed to copy plan from {from_period_var.get()} to {', '.join(targets)}")
 
         ttk.Button(popup, text="Copy", style="Success.TButton", command=save_copy).pack(pady=5)
 
     def get_periods(self):
         months = ["January", "February", "March", "April", "May", "June",
                   "July", "August", "September", "October", "November", "December"]
-        periods = [f"{month} {self.current_year}" for month in months]
-        next_year = self.current_year
-        while self.db.has_december_plan(self.user_id, next_year):
-            periods.extend([f"{month} {next_year + 1}" for month in months])
-            next_year += 1
-        return periods
+        return [f"{month} {year}" for year in self.get_years() for month in months]
+
+    def get_years(self):
+        """Years open for planning: the current year, plus the next one for each consecutive planned December."""
+        planned = self.db.plan_horizon(self.user_id)[1]
+        years = [self.current_year]
+        while f"December {years[-1]}" in planned:
+            years.append(years[-1] + 1)
+        return years
@@ -1,15 +1,20 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
+from tkcalendar import DateEntry
+from datetime import datetime
 from utils.database import Database
+from utils.executor import QueryExecutor
+from utils.exporter import export_all
 from utils.logging import log_info, log_error, log_debug
 from styles import apply_styles
 
 class SettingsPage(tk.Frame):
-    def __init__(self, parent, switch_page_callback, user_id):
+    def __init__(self, parent, switch_page_callback, user_id, db=None, executor=None):
         super().__init__(parent)
         self.switch_page_callback = switch_page_callback
         self.user_id = user_id
-        self.db = Database()
+        self.db = db or Database()
+        self.executor = executor or QueryExecutor(self)
         apply_styles()
         self.init_ui()
 
@@ -65,6 +70,7 @@ class SettingsPage(tk.Frame):
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=11, column=0, columnspan=3, pady=10)
         ttk.Button(button_frame, text="Save Preferences", style="Success.TButton", command=self.save_preferences).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Export Data", command=self.open_export).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Logout", style="Danger.TButton", command=self.logout).pack(side=tk.LEFT, padx=5)
 
         nav_frame = ttk.Frame(self)
@@ -79,7 +85,7 @@ class SettingsPage(tk.Frame):
 
     def is_planning_enabled(self):
         enabled = self.db.is_planning_enabled(self.user_id)
-        log_debug(self.user_id, f"Checked planning enabled: {enabled}")
+        log_debug(self.user_id, "Checked planning enabled: %s", enabled)
         return enabled
 
     def load_settings(self):
@@ -99,15 +105,20 @@ class SettingsPage(tk.Frame):
         log_info(self.user_id, "Loaded settings and profile")
 
     def save_preferences(self):
-        if self.db.update_settings(
+        self.executor.submit(
+            self.db.update_settings,
             self.user_id,
             self.currency_var.get(),
             self.savings_mode_var.get(),
             self.planning_enabled_var.get(),
             self.theme_var.get(),
             self.notifications_var.get(),
-            self.language_var.get()
-        ):
+            self.language_var.get(),
+            callback=self.on_preferences_saved
+        )
+
+    def on_preferences_saved(self, saved):
+        if saved:
             messagebox.showinfo("Success", "Preferences saved")
             self.switch_page_callback("Settings")
             log_info(self.user_id, "Saved preferences")
@@ -137,13 +148,7 @@ class SettingsPage(tk.Frame):
                     messagebox.showerror("Error", "Username already taken")
                     log_error(self.user_id, f"Username {value} already taken")
                     return
-                if self.db.update_user_profile(self.user_id, value, self.email_var.get(), self.bio_var.get()):
-                    self.username_var.set(value)
-                    popup.destroy()
-                    log_info(self.user_id, f"Updated username to {value}")
-                else:
-                    messagebox.showerror("Error", "Failed to update username")
-                    log_error(self.user_id, f"Failed to update username {value}")
+                save_profile(value, self.email_var.get(), self.bio_var.get(), value, self.username_var)
             elif field == "email":
                 if not value or "@" not in value:
                     messagebox.showerror("Error", "Invalid email format")
@@ -153,28 +158,75 @@ class SettingsPage(tk.Frame):
                     messagebox.showerror("Error", "Email already registered")
                     log_error(self.user_id, f"Email {value} already registered")
                     return
-                if self.db.update_user_profile(self.user_id, self.username_var.get(), value, self.bio_var.get()):
-                    self.email_var.set(value)
-                    popup.destroy()
-                    log_info(self.user_id, f"Updated email to {value}")
-                else:
-                    messagebox.showerror("Error", "Failed to update email")
-                    log_error(self.user_id, f"Failed to update email {value}")
+                save_profile(self.username_var.get(), value, self.bio_var.get(), value, self.email_var)
             elif field == "bio":
-                if self.db.update_user_profile(self.user_id, self.username_var.get(), self.email_var.get(), value):
-                    self.bio_var.set(value)
-                    popup.destroy()
-                    log_info(self.user_id, f"Updated bio to {value}")
-                else:
-                    messagebox.showerror("Error", "Failed to update bio")
-                    log_error(self.user_id, f"Failed to update bio {value}")
+                save_profile(self.username_var.get(), self.email_var.get(), value, value, self.bio_var)
+
+        def save_profile(username, email, bio, value, value_var):
+            self.executor.submit(self.db.update_user_profile, self.user_id, username, email, bio,
+                                 callback=lambda updated: on_saved(updated, value, value_var))
+
+        def on_saved(updated, value, value_var):
+            if updated:
+                value_var.set(value)
+                popup.destroy()
+                log_info(self.user_id, f"Updated {field} to {value}")
+            else:
+                messagebox.showerror("Error", f"Failed to update {field}")
+                log_error(self.user_id, f"Failed to update {field} {value}")
 
         ttk.Button(popup, text="Save", style="Success.TButton", command=save).pack(pady=10)
 
+    def open_export(self):
+        popup = tk.Toplevel(self)
+        popup.title("Export Data")
+        popup.geometry("300x250")
+        popup.transient(self)
+        popup.grab_set()
+
+        ttk.Label(popup, text="Format:").pack(pady=5)
+        format_var = tk.StringVar(value="CSV")
+        ttk.Combobox(popup, textvariable=format_var, values=["CSV", "Columnar"], state="readonly").pack(pady=5)
+        all_dates_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(popup, text="All dates", variable=all_dates_var).pack(pady=5)
+        range_frame = ttk.Frame(popup)
+        range_frame.pack(pady=5)
+        start_date = DateEntry(range_frame, date_pattern="mm/dd/yyyy")
+        start_date.pack(side=tk.LEFT, padx=5)
+        end_date = DateEntry(range_frame, date_pattern="mm/dd/yyyy")
+        end_date.pack(side=tk.LEFT, padx=5)
+
+        def export():
+            directory = filedialog.askdirectory(parent=popup, title="Export To")
+            if not directory:
+                return
+            start = end = None
+            if not all_dates_var.get():
+                start = datetime.strptime(start_date.get(), "%m/%d/%Y")
+                end = datetime.strptime(end_date.get(), "%m/%d/%Y")
+            fmt = format_var.get().lower()
+            popup.destroy()
+            self.executor.submit(export_all, self.db, self.user_id, directory, fmt, start, end,
+                                 callback=lambda counts: self.on_exported(directory, counts),
+                                 errback=self.on_export_failed)
+            log_info(self.user_id, f"Started {fmt} export to {directory}")
+
+        ttk.Button(popup, text="Export", style="Success.TButton", command=export).pack(pady=10)
+
+    def on_exported(self, directory, counts):
+        summary = ", ".join(f"{rows:,} {table}" for table, rows in counts.items())
+        messagebox.showinfo("Export Complete", f"Exported {summary} to {directory}")
+
+    def on_export_failed(self, error):
+        messagebox.showerror("Export Failed", str(error))
+        log_error(self.user_id, f"Export failed: {str(error)}")
+
     def logout(self):
         if messagebox.askyesno("Logout", "Are you sure you want to logout?"):
-            self.db.close()
-            self.master.geometry("400x400")
-            self.master.center_window(400, 400)
-            self.switch_page_callback("Login")
-            log_info(self.user_id, "User logged out")
\ No newline at end of file
+            self.executor.submit(self.db.logout, self.user_id, callback=lambda result: self.on_logged_out())
+
+    def on_logged_out(self):
+        self.master.geometry("400x400")
+        self.master.center_window(400, 400)
+        self.switch_page_callback("Login")
+        log_info(self.user_id, "User logged out")
\ No newline at end of file
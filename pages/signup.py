@@ -6,10 +6,10 @@ from styles import apply_styles
 import re
 
 class SignupPage(tk.Frame):
-    def __init__(self, parent, switch_page_callback):
+    def __init__(self, parent, switch_page_callback, db=None):
         super().__init__(parent)
         self.switch_page_callback = switch_page_callback
-        self.db = Database()
+        self.db = db or Database()
         apply_styles()
         self.init_ui()
 
@@ -1,17 +1,21 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from tkcalendar import DateEntry
 from datetime import datetime
 from utils.database import Database
 from utils.logging import log_info, log_error, log_debug
 from styles import apply_styles
+from pages.ledger import LedgerView
+from utils.executor import QueryExecutor
+from utils.importer import import_transactions
 
 class TrackingPage(tk.Frame):
-    def __init__(self, parent, switch_page_callback, user_id):
+    def __init__(self, parent, switch_page_callback, user_id, db=None, executor=None):
         super().__init__(parent)
         self.switch_page_callback = switch_page_callback
         self.user_id = user_id
-        self.db = Database()
+        self.db = db or Database()
+        self.executor = executor or QueryExecutor(self)
         apply_styles()
         self.init_ui()
 
@@ -34,6 +38,8 @@ class TrackingPage(tk.Frame):
         ttk.Button(control_frame, text="New Record", style="Success.TButton", command=self.open_new_record).pack(side=tk.LEFT, padx=5)
         ttk.Button(control_frame, text="Quick Add", command=self.quick_add).pack(side=tk.LEFT, padx=5)
         ttk.Button(control_frame, text="Undo Delete", command=self.undo_delete).pack(side=tk.LEFT, padx=5)
+        self.import_button = ttk.Button(control_frame, text="Import", command=self.import_statement)
+        self.import_button.pack(side=tk.LEFT, padx=5)
         self.filter_var = tk.StringVar(value="All")
         ttk.Combobox(control_frame, textvariable=self.filter_var, values=["All", "Today", "Week", "Month", "Year", "Range"], state="readonly").pack(side=tk.LEFT, padx=5)
         self.start_date = DateEntry(control_frame, date_pattern="mm/dd/yyyy")
@@ -44,11 +50,10 @@ class TrackingPage(tk.Frame):
         self.status_label = ttk.Label(control_frame, text="Showing transactions for: All")
         self.status_label.pack(side=tk.LEFT, padx=5)
 
-        table_frame = ttk.Frame(self)
-        table_frame.grid(row=3, column=0, sticky="nsew", padx=10, pady=5)
-        table_frame.grid_columnconfigure(0, weight=1)
-        table_frame.grid_rowconfigure(0, weight=1)
-        self.tree = ttk.Treeview(table_frame, columns=("Date", "Type", "Category", "Amount", "Mode", "Details", "Actions"), show="headings")
+        self.ledger = LedgerView(self, self.db, self.executor, self.user_id,
+                                 ("Date", "Type", "Category", "Amount", "Mode", "Details", "Actions"), self.format_row)
+        self.ledger.grid(row=3, column=0, sticky="nsew", padx=10, pady=5)
+        self.tree = self.ledger.tree
         self.tree.heading("Date", text="Date")
         self.tree.heading("Type", text="Type")
         self.tree.heading("Category", text="Category")
@@ -63,10 +68,8 @@ class TrackingPage(tk.Frame):
         self.tree.column("Mode", width=100)
         self.tree.column("Details", width=200)
         self.tree.column("Actions", width=100)
-        self.tree.grid(row=0, column=0, sticky="nsew")
-        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
-        scrollbar.grid(row=0, column=1, sticky="ns")
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.tag_configure("flagged", background="yellow")
+        self.tree.bind("<Double-1>", self.prompt_add_to_plan)
 
         nav_frame = ttk.Frame(self)
         nav_frame.grid(row=4, column=0, sticky="ew", padx=10, pady=5)
@@ -80,55 +83,44 @@ class TrackingPage(tk.Frame):
 
     def is_planning_enabled(self):
         enabled = self.db.is_planning_enabled(self.user_id)
-        log_debug(self.user_id, f"Checked planning enabled: {enabled}")
+        log_debug(self.user_id, "Checked planning enabled: %s", enabled)
         return enabled
 
+    def format_row(self, trans):
+        id, date, type, category, amount, mode, details, flagged, key = trans
+        tag = "flagged" if flagged else ""
+        return (date, type, category, f"KSh {amount:,}", mode, details, "Delete"), tag
+
     def update_content(self):
-        self.tree.delete(*self.tree.get_children())
         date_filter = self.filter_var.get()
         start_date = self.start_date.get() if date_filter == "Range" else None
         end_date = self.end_date.get() if date_filter == "Range" else None
-        transactions = self.db.get_transactions(self.user_id, date_filter, start_date, end_date)
-
-        cash_balance, mpesa_balance, income_total, expenses_total, savings_total = 0, 0, 0, 0, 0
-        for trans in transactions:
-            id, date, type, category, amount, mode, details, flagged = trans
-            tag = "flagged" if flagged else ""
-            self.tree.insert("", "end", values=(date, type, category, f"KSh {amount:,}", mode, details, "Delete"), tags=tag)
-            if type == "Income":
-                income_total += amount
-                if mode == "Cash":
-                    cash_balance += amount
-                else:
-                    mpesa_balance += amount
-            elif type == "Expenses":
-                expenses_total += amount
-                if mode == "Cash":
-                    cash_balance -= amount
-                else:
-                    mpesa_balance -= amount
-            else:
-                savings_total += amount
-                if mode == "Cash":
-                    cash_balance -= amount
-                else:
-                    mpesa_balance -= amount
-            if flagged:
-                self.tree.tag_configure("flagged", background="yellow")
-                self.tree.bind("<Double-1>", self.prompt_add_to_plan)
-
+        self.status_label.config(text=f"Loading transactions for: {date_filter}")
+        self.executor.submit(self.db.summarize, self.user_id, date_filter, start_date, end_date, key="tracking",
+                             callback=lambda summary: self.render_content(date_filter, start_date, end_date, summary))
+
+    def render_content(self, date_filter, start_date, end_date, summary):
+        self.ledger.load(date_filter, start_date, end_date, total=summary["count"])
+        cash_balance, mpesa_balance = summary["balances"]["Cash"], summary["balances"]["Mpesa"]
+        income_total = summary["totals"]["Income"]
+        expenses_total = summary["totals"]["Expenses"]
+        savings_total = summary["totals"]["Savings"]
         self.balance_label.config(text=f"Balance: Mpesa KSh {mpesa_balance:,}  Cash KSh {cash_balance:,}  Total KSh {mpesa_balance + cash_balance:,}")
         self.totals_label.config(text=f"Income: KSh {income_total:,}  Expenses: KSh {expenses_total:,}  Savings: KSh {savings_total:,}")
         self.status_label.config(text=f"Showing transactions for: {date_filter}")
-        log_info(self.user_id, f"Updated Tracking: {len(transactions)} transactions for {date_filter}")
+        log_info(self.user_id, f"Updated Tracking: {summary['count']} transactions for {date_filter}")
 
     def quick_add(self):
-        self.db.add_transaction(self.user_id, datetime.now().strftime("%b %d %Y"), "Income", "Salary", 50000, "Mpesa", "Monthly")
-        self.update_content()
+        self.executor.submit(self.db.add_transaction, self.user_id, datetime.now().strftime("%b %d %Y"),
+                             "Income", "Salary", 50000, "Mpesa", "Monthly",
+                             callback=lambda added: self.update_content())
         log_info(self.user_id, "Quick Added Salary transaction")
 
     def undo_delete(self):
-        if self.db.undo_delete(self.user_id):
+        self.executor.submit(self.db.undo_delete, self.user_id, callback=self.on_undo_delete)
+
+    def on_undo_delete(self, restored):
+        if restored:
             self.update_content()
             messagebox.showinfo("Success", "Transaction restored")
             log_info(self.user_id, "Undid last transaction deletion")
@@ -136,20 +128,46 @@ class TrackingPage(tk.Frame):
             messagebox.showerror("Error", "No transaction to restore")
             log_error(self.user_id, "Failed to undo transaction deletion")
 
+    def import_statement(self):
+        path = filedialog.askopenfilename(title="Import Transactions", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        self.import_button.config(state="disabled")
+        self.import_progress = (0, 0)
+        self.executor.submit(import_transactions, self.db, self.user_id, path,
+                             progress=lambda imported, skipped: setattr(self, "import_progress", (imported, skipped)),
+                             callback=self.on_imported, errback=self.on_import_failed)
+        self.show_import_progress()
+
+    def show_import_progress(self):
+        if str(self.import_button.cget("state")) != "disabled":
+            return
+        imported, skipped = self.import_progress
+        self.status_label.config(text=f"Importing: {imported:,} rows added, {skipped:,} skipped")
+        self.after(200, self.show_import_progress)
+
+    def on_imported(self, result):
+        self.import_button.config(state="normal")
+        self.update_content()
+        messagebox.showinfo("Import Complete", f"Imported {result['imported']:,} transactions, skipped {result['skipped']:,} rows "
+                                               f"and {result['duplicates']:,} already imported")
+
+    def on_import_failed(self, error):
+        self.import_button.config(state="normal")
+        self.status_label.config(text="Import failed")
+        messagebox.showerror("Import Failed", str(error))
+
     def prompt_add_to_plan(self, event):
-        item = self.tree.selection()[0]
-        values = self.tree.item(item, "values")
-        if values[7] == "1":  # Flagged
-            type, category = values[2], values[3]
-            if messagebox.askyesno("Unplanned Category", f"Add {category} ({type}) to plan for {datetime.now().strftime('%B %Y')}?"):
-                self.db.add_plan(self.user_id, datetime.now().strftime("%B %Y"), type, category, 0, "None", "")
-                self.db.cursor.execute(
-                    "UPDATE transactions SET flagged = 0 WHERE user_id = ? AND type = ? AND category = ?",
-                    (self.user_id, type, category)
-                )
-                self.db.conn.commit()
-                self.update_content()
-                log_info(self.user_id, f"Added unplanned category {type}/{category} to plan")
+        item = self.tree.identify_row(event.y)
+        if not item or "flagged" not in self.tree.item(item, "tags"):
+            return
+        date, type, category = self.tree.item(item, "values")[:3]
+        period = datetime.strptime(date, "%b %d %Y").strftime("%B %Y")
+        if messagebox.askyesno("Unplanned Category", f"Add {category} ({type}) to plan for {period}?"):
+            # add_plan reflags that month's transactions, clearing this flag
+            self.executor.submit(self.db.add_plan, self.user_id, period, type, category, 0, "None", "",
+                                 callback=lambda added: self.ledger.refresh())
+            log_info(self.user_id, f"Added unplanned {type}/{category} to plan for {period}")
 
     def open_new_record(self):
         popup = tk.Toplevel(self)
@@ -188,13 +206,18 @@ class TrackingPage(tk.Frame):
                 if amount <= 0:
                     raise ValueError("Amount must be positive")
                 date_str = datetime.strptime(date_var.get(), "%m/%d/%Y").strftime("%b %d %Y")
-                if self.db.add_transaction(self.user_id, date_str, type_var.get(), category_var.get(), amount, mode_var.get(), details_var.get()):
-                    self.update_content()
-                    popup.destroy()
-                    log_info(self.user_id, f"Added transaction: {date_str}, {type_var.get()}/{category_var.get()}")
-                else:
-                    messagebox.showerror("Error", "Failed to add transaction")
-                    log_error(self.user_id, f"Failed to add transaction: {date_str}, {type_var.get()}/{category_var.get()}")
+                type, category = type_var.get(), category_var.get()
+
+                def on_saved(added):
+                    if added:
+                        self.update_content()
+                        popup.destroy()
+                        log_info(self.user_id, f"Added transaction: {date_str}, {type}/{category}")
+                    else:
+                        messagebox.showerror("Error", "Failed to add transaction")
+                        log_error(self.user_id, f"Failed to add transaction: {date_str}, {type}/{category}")
+                self.executor.submit(self.db.add_transaction, self.user_id, date_str, type, category,
+                                     amount, mode_var.get(), details_var.get(), callback=on_saved)
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
                 log_error(self.user_id, f"Transaction validation failed: {str(e)}")
@@ -0,0 +1,100 @@
+import math
+import time
+from utils.logging import log_debug, log_info
+
+def figure_canvas(master, figsize):
+    """Create a Figure embedded in a Tk widget, importing matplotlib on first use."""
+    started = time.perf_counter()
+    # matplotlib is the slowest import in the app, so it waits until a chart is first shown
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    imported = time.perf_counter()
+    figure = Figure(figsize=figsize)
+    canvas = FigureCanvasTkAgg(figure, master=master)
+    if imported - started > 0.05:
+        log_info(0, f"Imported matplotlib in {(imported - started) * 1000:.0f} ms")
+    return figure, figure.add_subplot(111), canvas
+
+class PieChart:
+    """Pie chart embedded in Tk that keeps its wedges and moves them when only the values change.
+
+    update() is skipped entirely when called again with the same key.
+    """
+    def __init__(self, master, figsize=(4, 2)):
+        self.figure, self.ax, self.canvas = figure_canvas(master, figsize)
+        self.key = None
+        self.labels = None
+        self.colors = None
+        self.wedges, self.texts, self.autotexts = [], [], []
+
+    def widget(self):
+        return self.canvas.get_tk_widget()
+
+    def update(self, key, labels, sizes, colors=None, title=""):
+        """Show new slices; returns False if key matches what is already drawn."""
+        if key is not None and key == self.key:
+            log_debug(0, "Pie chart unchanged for %s", key)
+            return False
+        self.key = key
+        sizes = [size if size > 0 else 0.01 for size in sizes]
+        if labels == self.labels and colors == self.colors:
+            self.move_wedges(sizes)
+        else:
+            self.ax.clear()
+            self.wedges, self.texts, self.autotexts = self.ax.pie(sizes, labels=labels, colors=colors,
+                                                                  autopct="%1.1f%%", startangle=90)
+            self.ax.axis("equal")
+            self.labels, self.colors = labels, colors
+        self.ax.set_title(title)
+        self.canvas.draw_idle()
+        return True
+
+    def move_wedges(self, sizes):
+        """Re-angle the existing wedges and their labels the way Axes.pie lays them out."""
+        total = sum(sizes)
+        theta1 = 90
+        for wedge, text, autotext, size in zip(self.wedges, self.texts, self.autotexts, sizes):
+            theta2 = theta1 + 360 * size / total
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+            angle = math.radians((theta1 + theta2) / 2)
+            x, y = math.cos(angle), math.sin(angle)
+            text.set_position((1.1 * x, 1.1 * y))
+            text.set_horizontalalignment("left" if x > 0 else "right")
+            autotext.set_position((0.6 * x, 0.6 * y))
+            autotext.set_text(f"{100 * size / total:.1f}%")
+            theta1 = theta2
+
+class BarChart:
+    """Bar chart embedded in Tk that changes bar heights in place while the x values stay the same."""
+    def __init__(self, master, figsize=(4, 2), ylabel=""):
+        self.figure, self.ax, self.canvas = figure_canvas(master, figsize)
+        self.ylabel = ylabel
+        self.key = None
+        self.x = None
+        self.bars = []
+
+    def widget(self):
+        return self.canvas.get_tk_widget()
+
+    def update(self, key, x, heights, xlabel="", title="", color="blue"):
+        """Show new bars; returns False if key matches what is already drawn."""
+        if key is not None and key == self.key:
+            log_debug(0, "Bar chart unchanged for %s", key)
+            return False
+        self.key = key
+        if list(x) == self.x:
+            for bar, height in zip(self.bars, heights):
+                bar.set_height(height)
+            self.ax.relim()
+            self.ax.autoscale_view()
+        else:
+            self.ax.clear()
+            self.bars = self.ax.bar(x, heights, color=color)
+            self.x = list(x)
+            self.ax.set_xlabel(xlabel)
+            self.ax.set_ylabel(self.ylabel)
+            self.figure.tight_layout()
+        self.ax.set_title(title)
+        self.canvas.draw_idle()
+        return True
@@ -1,16 +1,344 @@
+import os
 import sqlite3
 import hashlib
 import re
-from datetime import datetime, timedelta
+import queue
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from utils.logging import log_info, log_error, log_debug
+from utils.recurrence import plan_due_keys
+from utils import sqltrace
+
+# Bump when a new step is added to Database.migrate().
+SCHEMA_VERSION = 6
+
+# date_key of legacy rows whose date text could not be parsed: they sort after every dated
+# row, match no date range, and roll up into month 0.
+UNDATED_KEY = 0
+
+MONTH_ABBRS = "JanFebMarAprMayJunJulAugSepOctNovDec"
+
+# SQL expression converting a legacy "%b %d %Y" date column into a YYYYMMDD integer.
+DATE_KEY_SQL = f"""
+    CAST(substr(date, 8, 4) AS INTEGER) * 10000
+    + ((instr('{MONTH_ABBRS}', substr(date, 1, 3)) + 2) / 3) * 100
+    + CAST(substr(date, 5, 2) AS INTEGER)
+"""
+
+# SQL expressions splitting a plan period ("January 2025", or "2025" / "Total 2025" for a
+# whole year) into its year and month; month is 0 for year-level periods.
+PLAN_YEAR_SQL = "CAST(substr(period, -4) AS INTEGER)"
+PLAN_MONTH_SQL = f"((instr('{MONTH_ABBRS}', substr(period, 1, 3)) + 2) / 3)"
+
+# Secondary indexes owned by the schema layer: name -> (table, columns).
+# Any other idx_* index found in the database is dropped by Database.create_indexes().
+INDEXES = {
+    "idx_users_logged_in": ("users", "is_logged_in"),
+    "idx_transactions_user_date": ("transactions", "user_id, date_key"),
+    "idx_transactions_user_type_category": ("transactions", "user_id, type, category"),
+    "idx_plans_user_type_category": ("plans", "user_id, type, category"),
+    "idx_plans_user_year_month": ("plans", "user_id, year, month"),
+    "idx_plan_occurrences_user_due": ("plan_occurrences", "user_id, due_key"),
+    "idx_deleted_transactions_user_deleted": ("deleted_transactions", "user_id, deleted_at"),
+}
+
+# PRAGMA sets applied to every connection; pick one with PENNY_STORAGE_PROFILE or Database(profile=...).
+# cache_size is in KiB when negative, mmap_size in bytes.
+STORAGE_PROFILES = {
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+    },
+    "desktop": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+    "bulk": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+DEFAULT_STORAGE_PROFILE = "desktop"
+
+# Longest horizon get_monthly_trends will aggregate (ten years).
+MAX_TREND_MONTHS = 120
+
+# ISO date for a date_key column, for use with SQLite date functions.
+DATE_SQL = "printf('%04d-%02d-%02d', date_key / 10000, date_key / 100 % 100, date_key % 100)"
+
+# Trend bucket -> (SQL bucket key over transactions.date_key, SQL bucket key over
+# monthly_rollups.month or None, label format). Transactions carry no time of day, so
+# the finest bucket is a day. Week buckets are keyed by their Monday. Buckets with a
+# rollup key are summed from monthly_rollups instead of raw transactions.
+TREND_BUCKETS = {
+    "day": ("date_key", None, "%b %d"),
+    "week": (f"CAST(strftime('%Y%m%d', {DATE_SQL}, 'weekday 0', '-6 days') AS INTEGER)", None, "%b %d"),
+    "month": ("date_key / 100", "month", "%b %Y"),
+    "year": ("date_key / 10000", "month / 100", "%Y"),
+}
+DEFAULT_TREND_SPANS = {
+    "day": timedelta(days=6),
+    "week": timedelta(weeks=7),
+    "month": timedelta(days=150),
+    "year": timedelta(days=4 * 365),
+}
+# Exportable tables: (column, "int" | "text") pairs, the (SQL key, divisor, whole-year condition)
+# a YYYYMMDD date range filters on, and the row order. The key is compared with the range bounds
+# divided by divisor; rows matching the whole-year condition are kept if their year is in range.
+EXPORT_TABLES = {
+    "transactions": (
+        (("id", "int"), ("date", "text"), ("type", "text"), ("category", "text"), ("amount", "int"),
+         ("mode", "text"), ("details", "text"), ("flagged", "int"), ("date_key", "int")),
+        ("date_key", 1, None),
+        "date_key, id",
+    ),
+    "plans": (
+        (("id", "int"), ("period", "text"), ("year", "int"), ("month", "int"), ("type", "text"), ("category", "text"),
+         ("amount", "int"), ("recurrence", "text"), ("due", "text"), ("custom_period", "text")),
+        ("year * 100 + month", 100, "month = 0"),
+        "id",
+    ),
+    "monthly_rollups": (
+        (("month", "int"), ("type", "text"), ("category", "text"), ("mode", "text"), ("total", "int"), ("count", "int")),
+        ("month", 100, None),
+        "month, type, category, mode",
+    ),
+}
+# ON CONFLICT actions for copy_plan when the target period already plans a category
+COPY_POLICIES = {
+    "skip": "DO NOTHING",
+    "overwrite": "DO UPDATE SET amount = excluded.amount, recurrence = excluded.recurrence, "
+                 "due = excluded.due, custom_period = excluded.custom_period",
+    "add": "DO UPDATE SET amount = plans.amount + excluded.amount",
+}
+
+def period_parts(period):
+    """Split a plan period into (year, month) the way PLAN_YEAR_SQL and PLAN_MONTH_SQL do."""
+    year = int(period[-4:]) if period[-4:].isdigit() else None
+    return year, (MONTH_ABBRS.find(period[:3]) + 3) // 3
+
+def date_key(value):
+    """Convert a '%b %d %Y' date string or datetime into a sortable YYYYMMDD integer."""
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%b %d %Y")
+    return value.year * 10000 + value.month * 100 + value.day
+
+def writes(method):
+    """Serialize a Database method on the pool's single writer connection.
+
+    Methods whose first argument is a user_id also bump that user's data version,
+    or inside bulk() once the batch has been committed.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.pool.write_lock:
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                if args and isinstance(args[0], int):
+                    if self.pool.batch_depth:
+                        self.batch_users.add(args[0])
+                    else:
+                        self.bump_data_version(args[0])
+    return wrapper
+
+class ConnectionPool:
+    """Process-wide connections to one database file: a single writer plus a small pool of readers."""
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db_name="penny.db", readers=3, profile=None, tracer=None):
+        self.db_name = db_name
+        self.tracer = tracer or sqltrace.TRACER  # utils.sqltrace.SqlTracer timing every statement, if any
+        self.profile_name = profile or os.environ.get("PENNY_STORAGE_PROFILE", DEFAULT_STORAGE_PROFILE)
+        if self.profile_name not in STORAGE_PROFILES:
+            log_error(0, f"Unknown storage profile {self.profile_name}, using {DEFAULT_STORAGE_PROFILE}")
+            self.profile_name = DEFAULT_STORAGE_PROFILE
+        self.profile = STORAGE_PROFILES[self.profile_name]
+        self.write_lock = threading.RLock()
+        self.batch_depth = 0
+        self.schema_checked = False
+        self.closed = False
+        self.writer = self.connect()
+        log_info(0, f"Storage profile {self.profile_name} for {db_name}: {self.storage_report()}")
+        self.readers = queue.LifoQueue()
+        # Each ":memory:" connection is a separate database, so readers fall back to the writer.
+        if db_name != ":memory:":
+            for _ in range(readers):
+                self.readers.put(self.connect())
+        log_info(0, f"Opened connection pool for {db_name} with {self.readers.qsize()} readers")
+
+    @classmethod
+    def shared(cls, db_name="penny.db", profile=None):
+        """Return the process-wide pool for a database file, opening it on first use."""
+        if db_name == ":memory:":
+            return cls(db_name, profile=profile)
+        with cls._shared_lock:
+            pool = cls._shared.get(db_name)
+            if pool is None or pool.closed:
+                pool = cls._shared[db_name] = cls(db_name, profile=profile)
+            elif profile and profile != pool.profile_name:
+                log_error(0, f"{db_name} is already open with storage profile {pool.profile_name}, ignoring {profile}")
+            return pool
+
+    def connect(self):
+        """Open a new connection usable from worker threads and apply the storage profile."""
+        if self.tracer:
+            conn = sqltrace.connect(self.tracer, self.db_name, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        for pragma, value in self.profile.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def storage_report(self):
+        """Return the PRAGMA values actually in effect on the writer connection."""
+        report = {}
+        for pragma in self.profile:
+            row = self.writer.execute(f"PRAGMA {pragma}").fetchone()
+            report[pragma] = row[0] if row else None  # in-memory databases report no mmap_size
+        return report
+
+    def connections(self):
+        """Return the writer followed by every idle reader connection."""
+        return [self.writer] + list(self.readers.queue)
+
+    @contextmanager
+    def reader(self):
+        """Borrow a reader connection for the duration of a read-only query."""
+        if self.db_name == ":memory:":
+            with self.write_lock:
+                yield self.writer
+            return
+        conn = self.readers.get()
+        try:
+            yield conn
+        finally:
+            self.readers.put(conn)
+
+    def close(self):
+        """Close every connection in the pool."""
+        with self.write_lock:
+            for conn in self.connections():
+                conn.close()
+            self.closed = True
+        log_info(0, f"Closed connection pool for {self.db_name}")
+
+def bucket_start(bucket, day):
+    """Return the first date of the trend bucket containing `day`."""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    if bucket == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+def next_bucket(bucket, day):
+    """Return the first date of the trend bucket after the one starting on `day`."""
+    if bucket == "week":
+        return day + timedelta(weeks=1)
+    if bucket == "month":
+        return day.replace(year=day.year + day.month // 12, month=day.month % 12 + 1, day=1)
+    if bucket == "year":
+        return day.replace(year=day.year + 1, month=1, day=1)
+    return day + timedelta(days=1)
+
+def bucket_key(bucket, day):
+    """Return the SQL bucket key (see TREND_BUCKETS) for the bucket starting on `day`."""
+    key = date_key(day)
+    if bucket == "month":
+        return key // 100
+    if bucket == "year":
+        return key // 10000
+    return key
+
+def bucket_date(bucket, key):
+    """Return the first date of the bucket identified by a SQL bucket key."""
+    if bucket == "month":
+        key = key * 100 + 1
+    elif bucket == "year":
+        key = key * 10000 + 101
+    return date(key // 10000, key // 100 % 100, key % 100)
 
 class Database:
-    def __init__(self, db_name="penny.db"):
-        """Initialize database connection."""
-        self.conn = sqlite3.connect(db_name)
+    def __init__(self, db_name="penny.db", pool=None, profile=None):
+        """Attach to the shared connection pool, checking the schema once per pool."""
+        self.pool = pool or ConnectionPool.shared(db_name, profile)
+        self.conn = self.pool.writer
         self.cursor = self.conn.cursor()
-        self.create_tables()
+        self.plan_horizons = {}  # user_id -> (max planned year, planned periods), dropped on plan writes
+        self.data_versions = {}  # user_id -> counter bumped by every write, for caches of derived views
+        self.batch_users = set()  # users written inside bulk(), whose versions are bumped when it ends
+        self.user_cache = {}  # user_id -> (profile row, settings row), dropped on profile/settings writes
+        with self.pool.write_lock:
+            if not self.pool.schema_checked:
+                self.create_tables()
+                self.migrate()
+                self.pool.schema_checked = True
+
+    def commit(self):
+        """Commit the writer's transaction unless a bulk() block is collecting writes."""
+        if self.pool.batch_depth == 0:
+            self.conn.commit()
+
+    @contextmanager
+    def bulk(self):
+        """Group several write calls into one transaction that is committed once at the end."""
+        with self.pool.write_lock:
+            self.pool.batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.pool.batch_depth -= 1
+                if self.pool.batch_depth == 0:
+                    self.conn.rollback()
+                    log_error(0, "Bulk write rolled back")
+                    self.end_batch()
+                raise
+            self.pool.batch_depth -= 1
+            if self.pool.batch_depth == 0:
+                self.conn.commit()
+                self.end_batch()
+
+    def end_batch(self):
+        """Bump the data versions of users written in a finished bulk(), now that readers see the result."""
+        for user_id in self.batch_users:
+            self.bump_data_version(user_id)
+        self.batch_users = set()
+
+    def fetchall(self, query, params=()):
+        """Run a read-only query on a pooled reader connection and return every row."""
+        with self.pool.reader() as conn:
+            return conn.execute(query, params).fetchall()
 
+    def fetchone(self, query, params=()):
+        """Run a read-only query on a pooled reader connection and return the first row."""
+        with self.pool.reader() as conn:
+            return conn.execute(query, params).fetchone()
+
+    def iter_rows(self, query, params=(), batch_size=1000):
+        """Yield the rows of a read-only query in fetchmany batches, holding one reader throughout."""
+        with self.pool.reader() as conn:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+    @writes
     def create_tables(self):
         """Create necessary database tables."""
         self.cursor.execute("""
@@ -59,6 +387,7 @@ class Database:
                 mode TEXT NOT NULL,
                 details TEXT,
                 flagged INTEGER DEFAULT 0,
+                date_key INTEGER,
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
         """)
@@ -73,6 +402,8 @@ class Database:
                 recurrence TEXT,
                 due TEXT,
                 custom_period TEXT,
+                year INTEGER,
+                month INTEGER,
                 UNIQUE(user_id, period, type, category),
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
@@ -89,17 +420,114 @@ class Database:
                 mode TEXT,
                 details TEXT,
                 flagged INTEGER,
+                date_key INTEGER,
                 deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
         """)
-        self.conn.commit()
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS monthly_rollups (
+                user_id INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                category TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month, type, category, mode),
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS plan_occurrences (
+                plan_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                due_key INTEGER NOT NULL,
+                PRIMARY KEY (plan_id, due_key),
+                FOREIGN KEY (plan_id) REFERENCES plans(id)
+            )
+        """)
+        self.commit()
         log_info(0, "Database tables created or verified")
 
+    @writes
+    def migrate(self):
+        """Bring an existing database up to SCHEMA_VERSION."""
+        self.cursor.execute("PRAGMA user_version")
+        version = self.cursor.fetchone()[0]
+        if version < 1:
+            self.migrate_date_keys()
+        if version < 2:
+            self.rebuild_rollups()
+        if version < 3:
+            self.migrate_plan_periods()
+        if version < 4:
+            self.rebuild_occurrences()
+        if version < 5:
+            # Flags used to be computed against the month they were entered in, not their own
+            self.cursor.execute("SELECT user_id FROM users")
+            for (user_id,) in self.cursor.fetchall():
+                self.reflag_transactions(user_id)
+        if version < 6:
+            # Unparseable dates used to be left with a NULL date_key, which keyset paging skips
+            self.migrate_date_keys()
+            self.rebuild_rollups()
+        self.create_indexes()
+        if version < SCHEMA_VERSION:
+            self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            log_info(0, f"Migrated database schema from version {version} to {SCHEMA_VERSION}")
+        self.commit()
+
+    def create_indexes(self):
+        """Create the managed secondary indexes and drop stale ones."""
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'")
+        existing = {row[0] for row in self.cursor.fetchall()}
+        for name in existing - INDEXES.keys():
+            self.cursor.execute(f"DROP INDEX IF EXISTS {name}")
+            log_info(0, f"Dropped unmanaged index {name}")
+        for name, (table, columns) in INDEXES.items():
+            if name not in existing:
+                self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+                log_info(0, f"Created index {name} on {table}({columns})")
+
+    def migrate_date_keys(self):
+        """Add and backfill the integer date_key column from the legacy '%b %d %Y' text dates, or UNDATED_KEY if unparseable."""
+        for table in ("transactions", "deleted_transactions"):
+            self.cursor.execute(f"PRAGMA table_info({table})")
+            if "date_key" not in [row[1] for row in self.cursor.fetchall()]:
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN date_key INTEGER")
+            self.cursor.execute(
+                f"""
+                UPDATE {table} SET date_key = {DATE_KEY_SQL}
+                WHERE date_key IS NULL
+                AND date GLOB '[A-Z][a-z][a-z] [0-9][0-9] [0-9][0-9][0-9][0-9]'
+                """
+            )
+            log_info(0, f"Backfilled date_key for {self.cursor.rowcount} rows in {table}")
+            self.cursor.execute(f"UPDATE {table} SET date_key = ? WHERE date_key IS NULL", (UNDATED_KEY,))
+            if self.cursor.rowcount:
+                log_error(0, f"{self.cursor.rowcount} rows in {table} have unparseable dates, keyed as undated")
+
+    def migrate_plan_periods(self):
+        """Add and backfill the integer year and month columns of plans from their period text."""
+        self.cursor.execute("PRAGMA table_info(plans)")
+        columns = [row[1] for row in self.cursor.fetchall()]
+        for column in ("year", "month"):
+            if column not in columns:
+                self.cursor.execute(f"ALTER TABLE plans ADD COLUMN {column} INTEGER")
+        self.cursor.execute(
+            f"""
+            UPDATE plans SET year = {PLAN_YEAR_SQL}, month = {PLAN_MONTH_SQL}
+            WHERE period GLOB '*[0-9][0-9][0-9][0-9]'
+            """
+        )
+        log_info(0, f"Backfilled year and month for {self.cursor.rowcount} plans")
+
     def hash_password(self, password):
         """Hash a password using SHA-256."""
         return hashlib.sha256(password.encode()).hexdigest()
 
+    @writes
     def signup(self, username, email, password):
         """Register a new user with password validation."""
         if len(password) < 8:
@@ -120,13 +548,14 @@ class Database:
                 "INSERT INTO settings (user_id) VALUES (?)",
                 (user_id,)
             )
-            self.conn.commit()
+            self.commit()
             log_info(user_id, f"User {username} signed up successfully")
             return user_id
         except sqlite3.IntegrityError as e:
             log_error(0, f"Signup failed for {username}: {str(e)}")
             return None
 
+    @writes
     def login(self, username, password):
         """Authenticate a user with rate limiting."""
         try:
@@ -150,7 +579,7 @@ class Database:
                     "UPDATE users SET failed_attempts = 0, is_logged_in = 1 WHERE user_id = ?",
                     (user_id,)
                 )
-                self.conn.commit()
+                self.commit()
                 log_info(user_id, f"User {username} logged in")
                 return user_id
             else:
@@ -160,13 +589,14 @@ class Database:
                     "UPDATE users SET failed_attempts = ?, lock_until = ? WHERE user_id = ?",
                     (failed_attempts, lock_until, user_id)
                 )
-                self.conn.commit()
+                self.commit()
                 log_error(0, f"Login failed for {username}: Invalid password")
                 return None
         except sqlite3.Error as e:
             log_error(0, f"Database error during login: {str(e)}")
             return None
 
+    @writes
     def logout(self, user_id):
         """Log out a user by resetting their login state."""
         try:
@@ -174,11 +604,13 @@ class Database:
                 "UPDATE users SET is_logged_in = 0 WHERE user_id = ?",
                 (user_id,)
             )
-            self.conn.commit()
+            self.commit()
+            self.invalidate_user(user_id)
             log_info(user_id, "User logged out")
         except sqlite3.Error as e:
             log_error(user_id, f"Logout failed: {str(e)}")
 
+    @writes
     def reset_password(self, username, email, new_password):
         """Reset a user's password with rate limiting and validation."""
         if len(new_password) < 8:
@@ -209,7 +641,7 @@ class Database:
                     "UPDATE users SET password_hash = ?, failed_attempts = 0 WHERE user_id = ?",
                     (password_hash, user_id)
                 )
-                self.conn.commit()
+                self.commit()
                 log_info(user_id, f"Password reset for {username}")
                 return user_id
             else:
@@ -219,7 +651,7 @@ class Database:
                     "UPDATE users SET failed_attempts = ?, lock_until = ? WHERE user_id = ?",
                     (failed_attempts, lock_until, user_id)
                 )
-                self.conn.commit()
+                self.commit()
                 log_error(0, f"Password reset failed for {username}: Invalid email")
                 return None
         except sqlite3.Error as e:
@@ -229,8 +661,7 @@ class Database:
     def get_logged_in_user(self):
         """Retrieve the currently logged-in user, if any."""
         try:
-            self.cursor.execute("SELECT user_id FROM users WHERE is_logged_in = 1")
-            result = self.cursor.fetchone()
+            result = self.fetchone("SELECT user_id FROM users WHERE is_logged_in = 1")
             if result:
                 log_debug(result[0], "Retrieved logged-in user")
                 return result[0]
@@ -247,9 +678,8 @@ class Database:
         if exclude_user_id:
             query += " AND user_id != ?"
             params.append(exclude_user_id)
-        self.cursor.execute(query, params)
-        exists = bool(self.cursor.fetchone())
-        log_debug(0 if not exclude_user_id else exclude_user_id, f"Checked username {username}: exists={exists}")
+        exists = bool(self.fetchone(query, params))
+        log_debug(0 if not exclude_user_id else exclude_user_id, "Checked username %s: exists=%s", username, exists)
         return exists
 
     def email_exists(self, email, exclude_user_id=None):
@@ -259,22 +689,45 @@ class Database:
         if exclude_user_id:
             query += " AND user_id != ?"
             params.append(exclude_user_id)
-        self.cursor.execute(query, params)
-        exists = bool(self.cursor.fetchone())
-        log_debug(0 if not exclude_user_id else exclude_user_id, f"Checked email {email}: exists={exists}")
+        exists = bool(self.fetchone(query, params))
+        log_debug(0 if not exclude_user_id else exclude_user_id, "Checked email %s: exists=%s", email, exists)
         return exists
 
-    def get_user_profile(self, user_id):
-        """Retrieve a user's profile information."""
+    def load_user(self, user_id):
+        """Return (profile, settings) rows for a user from one joined query, cached until either is updated."""
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            return cached
         try:
-            self.cursor.execute("SELECT username, email, bio FROM users WHERE user_id = ?", (user_id,))
-            profile = self.cursor.fetchone()
-            log_debug(user_id, f"Retrieved profile: {profile}")
-            return profile
+            row = self.fetchone(
+                """
+                SELECT u.username, u.email, u.bio,
+                       s.user_id, s.currency, s.savings_mode, s.planning_enabled, s.theme, s.notifications, s.language
+                FROM users u
+                LEFT JOIN settings s ON s.user_id = u.user_id
+                WHERE u.user_id = ?
+                """,
+                (user_id,)
+            )
         except sqlite3.Error as e:
-            log_error(user_id, f"Error retrieving profile: {str(e)}")
-            return None
+            log_error(user_id, f"Error loading profile and settings: {str(e)}")
+            return None, None
+        if row is None:
+            return None, None
+        cached = (row[:3], row[4:] if row[3] is not None else None)
+        self.user_cache[user_id] = cached
+        log_debug(user_id, "Loaded profile %s and settings %s", cached[0], cached[1])
+        return cached
+
+    def invalidate_user(self, user_id):
+        """Forget the cached profile and settings of a user."""
+        self.user_cache.pop(user_id, None)
 
+    def get_user_profile(self, user_id):
+        """Retrieve a user's profile information."""
+        return self.load_user(user_id)[0]
+
+    @writes
     def update_user_profile(self, user_id, username, email, bio):
         """Update a user's profile information."""
         try:
@@ -282,7 +735,8 @@ class Database:
                 "UPDATE users SET username = ?, email = ?, bio = ? WHERE user_id = ?",
                 (username, email, bio, user_id)
             )
-            self.conn.commit()
+            self.commit()
+            self.invalidate_user(user_id)
             log_info(user_id, f"Updated profile: username={username}, email={email}")
             return True
         except sqlite3.IntegrityError as e:
@@ -291,18 +745,9 @@ class Database:
 
     def get_settings(self, user_id):
         """Retrieve user settings."""
-        try:
-            self.cursor.execute(
-                "SELECT currency, savings_mode, planning_enabled, theme, notifications, language FROM settings WHERE user_id = ?",
-                (user_id,)
-            )
-            settings = self.cursor.fetchone()
-            log_debug(user_id, f"Retrieved settings: {settings}")
-            return settings
-        except sqlite3.Error as e:
-            log_error(user_id, f"Error retrieving settings: {str(e)}")
-            return None
+        return self.load_user(user_id)[1]
 
+    @writes
     def update_settings(self, user_id, currency, savings_mode, planning_enabled, theme, notifications, language):
         """Update user settings."""
         try:
@@ -310,7 +755,8 @@ class Database:
                 "UPDATE settings SET currency = ?, savings_mode = ?, planning_enabled = ?, theme = ?, notifications = ?, language = ? WHERE user_id = ?",
                 (currency, savings_mode, planning_enabled, theme, notifications, language, user_id)
             )
-            self.conn.commit()
+            self.commit()
+            self.invalidate_user(user_id)
             log_info(user_id, f"Updated settings: currency={currency}, planning_enabled={planning_enabled}")
             return True
         except sqlite3.IntegrityError as e:
@@ -319,15 +765,8 @@ class Database:
 
     def is_planning_enabled(self, user_id):
         """Check if planning is enabled for the user."""
-        try:
-            self.cursor.execute("SELECT planning_enabled FROM settings WHERE user_id = ?", (user_id,))
-            result = self.cursor.fetchone()
-            enabled = result[0] if result else True
-            log_debug(user_id, f"Planning enabled: {enabled}")
-            return enabled
-        except sqlite3.Error as e:
-            log_error(user_id, f"Error checking planning enabled: {str(e)}")
-            return True
+        settings = self.load_user(user_id)[1]
+        return settings[2] if settings else True
 
     def get_categories(self, user_id, type=None):
         """Retrieve categories for a user."""
@@ -337,14 +776,14 @@ class Database:
             query += " AND type = ?"
             params.append(type)
         try:
-            self.cursor.execute(query, params)
-            categories = [row[0] for row in self.cursor.fetchall()]
-            log_debug(user_id, f"Retrieved categories for type {type}: {categories}")
+            categories = [row[0] for row in self.fetchall(query, params)]
+            log_debug(user_id, "Retrieved categories for type %s: %s", type, categories)
             return categories
         except sqlite3.Error as e:
             log_error(user_id, f"Error retrieving categories: {str(e)}")
             return []
 
+    @writes
     def add_category(self, user_id, type, category):
         """Add a new category for a user."""
         try:
@@ -352,13 +791,14 @@ class Database:
                 "INSERT INTO categories (user_id, type, category) VALUES (?, ?, ?)",
                 (user_id, type, category)
             )
-            self.conn.commit()
+            self.commit()
             log_info(user_id, f"Added category: {type}/{category}")
             return True
         except sqlite3.IntegrityError:
-            log_debug(user_id, f"Category {type}/{category} already exists")
+            log_debug(user_id, "Category %s/%s already exists", type, category)
             return False
 
+    @writes
     def update_category(self, user_id, old_type, old_category, new_type, new_category):
         """Update a category for a user."""
         try:
@@ -374,13 +814,16 @@ class Database:
                 "UPDATE transactions SET type = ?, category = ? WHERE user_id = ? AND type = ? AND category = ?",
                 (new_type, new_category, user_id, old_type, old_category)
             )
-            self.conn.commit()
+            if (old_type, old_category) != (new_type, new_category):
+                self.move_rollups(user_id, old_type, old_category, new_type, new_category)
+            self.commit()
             log_info(user_id, f"Updated category: {old_type}/{old_category} to {new_type}/{new_category}")
             return True
         except sqlite3.IntegrityError as e:
             log_error(user_id, f"Update category failed: {str(e)}")
             return False
 
+    @writes
     def delete_category(self, user_id, type, category):
         """Delete a category if not used in transactions or plans."""
         try:
@@ -391,6 +834,13 @@ class Database:
             if self.cursor.fetchone():
                 log_error(user_id, f"Cannot delete category {type}/{category}: used in transactions")
                 return False
+            self.cursor.execute(
+                """
+                DELETE FROM plan_occurrences WHERE plan_id IN
+                    (SELECT id FROM plans WHERE user_id = ? AND type = ? AND category = ?)
+                """,
+                (user_id, type, category)
+            )
             self.cursor.execute(
                 "DELETE FROM plans WHERE user_id = ? AND type = ? AND category = ?",
                 (user_id, type, category)
@@ -399,7 +849,8 @@ class Database:
                 "DELETE FROM categories WHERE user_id = ? AND type = ? AND category = ?",
                 (user_id, type, category)
             )
-            self.conn.commit()
+            self.commit()
+            self.invalidate_plan_horizon(user_id)
             log_info(user_id, f"Deleted category: {type}/{category}")
             return True
         except sqlite3.Error as e:
@@ -410,15 +861,7 @@ class Database:
         """Retrieve budget plans for a user and period."""
         try:
             if period.startswith("Total"):
-                year = period.split()[-1]
-                query = """
-                    SELECT type, category, SUM(amount), recurrence, due
-                    FROM plans
-                    WHERE user_id = ? AND period LIKE ?
-                    GROUP BY type, category, recurrence, due
-                    ORDER BY type, SUM(amount) DESC
-                """
-                params = (user_id, f"% {year}")
+                return self.get_plan_totals(user_id, int(period.split()[-1]))
             else:
                 query = """
                     SELECT type, category, amount, recurrence, due
@@ -427,77 +870,231 @@ class Database:
                     ORDER BY type, amount DESC
                 """
                 params = (user_id, period)
-            self.cursor.execute(query, params)
-            plans = self.cursor.fetchall()
-            log_debug(user_id, f"Retrieved plans for {period}: {len(plans)} entries")
+            plans = self.fetchall(query, params)
+            log_debug(user_id, "Retrieved plans for %s: %s entries", period, len(plans))
             return plans
         except sqlite3.Error as e:
             log_error(user_id, f"Error retrieving plans: {str(e)}")
             return []
 
+    def get_plan_totals(self, user_id, start_year, end_year=None, quarter=None):
+        """Sum a user's plans per type and category over whole years, or one quarter of a year."""
+        end_year = end_year or start_year
+        first_month, last_month = (0, 12) if quarter is None else (3 * quarter - 2, 3 * quarter)
+        try:
+            plans = self.fetchall(
+                """
+                SELECT type, category, SUM(amount), MAX(recurrence), MAX(due)
+                FROM plans
+                WHERE user_id = ? AND year BETWEEN ? AND ? AND month BETWEEN ? AND ?
+                GROUP BY type, category
+                ORDER BY type, SUM(amount) DESC
+                """,
+                (user_id, start_year, end_year, first_month, last_month)
+            )
+            log_debug(user_id, "Retrieved plan totals for %s-%s months %s-%s: %s entries", start_year, end_year, first_month, last_month, len(plans))
+            return plans
+        except sqlite3.Error as e:
+            log_error(user_id, f"Error retrieving plan totals: {str(e)}")
+            return []
+
+    def get_variance(self, user_id, start_year, end_year=None, quarter=None, month=None):
+        """Return (type, category, planned, actual) rows comparing plans with monthly rollups over a period.
+
+        The period is one month, one quarter, or whole years (which include year-level plans).
+        Categories with spending but no plan are returned with planned = 0.
+        """
+        end_year = end_year or start_year
+        if month is not None:
+            first_month, last_month = month, month
+        elif quarter is not None:
+            first_month, last_month = 3 * quarter - 2, 3 * quarter
+        else:
+            first_month, last_month = 0, 12
+        try:
+            rows = self.fetchall(
+                """
+                WITH planned AS (
+                    SELECT type, category, SUM(amount) AS planned
+                    FROM plans
+                    WHERE user_id = ? AND year BETWEEN ? AND ? AND month BETWEEN ? AND ?
+                    GROUP BY type, category
+                ), actual AS (
+                    SELECT type, category, SUM(total) AS actual
+                    FROM monthly_rollups
+                    WHERE user_id = ? AND month BETWEEN ? AND ? AND month % 100 BETWEEN ? AND ?
+                    GROUP BY type, category
+                )
+                SELECT p.type, p.category, p.planned, COALESCE(a.actual, 0)
+                FROM planned p LEFT JOIN actual a ON a.type = p.type AND a.category = p.category
+                UNION ALL
+                SELECT a.type, a.category, 0, a.actual
+                FROM actual a
+                WHERE NOT EXISTS (SELECT 1 FROM planned p WHERE p.type = a.type AND p.category = a.category)
+                ORDER BY 1, 2
+                """,
+                (user_id, start_year, end_year, first_month, last_month,
+                 user_id, start_year * 100 + max(first_month, 1), end_year * 100 + last_month, first_month, last_month)
+            )
+            log_debug(user_id, "Computed variance for %s-%s months %s-%s: %s categories", start_year, end_year, first_month, last_month, len(rows))
+            return rows
+        except sqlite3.Error as e:
+            log_error(user_id, f"Error computing variance: {str(e)}")
+            return []
+
+    @writes
     def add_plan(self, user_id, period, type, category, amount, recurrence, due, custom_period=None):
         """Add or update a budget plan for a user."""
         try:
             self.cursor.execute(
                 """
-                INSERT OR REPLACE INTO plans (user_id, period, type, category, amount, recurrence, due, custom_period)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO plans (user_id, period, year, month, type, category, amount, recurrence, due, custom_period)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, period, type, category) DO UPDATE SET
+                    amount = excluded.amount, recurrence = excluded.recurrence,
+                    due = excluded.due, custom_period = excluded.custom_period
                 """,
-                (user_id, period, type, category, amount, recurrence, due, custom_period)
+                (user_id, period, *period_parts(period), type, category, amount, recurrence, due, custom_period)
             )
+            self.write_occurrences("user_id = ? AND period = ? AND type = ? AND category = ?",
+                                   (user_id, period, type, category))
             self.add_category(user_id, type, category)
-            self.conn.commit()
+            year, month = period_parts(period)
+            if year and month:
+                self.reflag_transactions(user_id, year * 10000 + month * 100, year * 10000 + month * 100 + 99)
+            self.commit()
+            self.invalidate_plan_horizon(user_id)
             log_info(user_id, f"Added plan: {period}, {type}/{category}, KSh {amount}")
             return True
         except sqlite3.Error as e:
             log_error(user_id, f"Add plan failed: {str(e)}")
             return False
 
-    def copy_plan(self, user_id, from_period, to_period):
-        """Copy budget plans from one period to another."""
+    @writes
+    def copy_plan(self, user_id, from_period, to_periods, policy="skip"):
+        """Copy budget plans from one period to one or more periods, resolving existing rows by policy."""
+        if isinstance(to_periods, str):
+            to_periods = [to_periods]
+        targets = [period for period in dict.fromkeys(to_periods) if period != from_period]
+        if policy not in COPY_POLICIES:
+            log_error(user_id, f"Copy plan failed: unknown policy {policy}")
+            return False
+        if not targets:
+            log_debug(user_id, "Copy plan from %s: no target periods", from_period)
+            return True
         try:
             self.cursor.execute(
-                """
-                SELECT type, category, amount, recurrence, due, custom_period
-                FROM plans
-                WHERE user_id = ? AND period = ?
+                f"""
+                WITH targets(period, year, month) AS (VALUES {', '.join(['(?, ?, ?)'] * len(targets))})
+                INSERT INTO plans (user_id, period, year, month, type, category, amount, recurrence, due, custom_period)
+                SELECT p.user_id, targets.period, targets.year, targets.month, p.type, p.category, p.amount, p.recurrence, p.due, p.custom_period
+                FROM plans p, targets
+                WHERE p.user_id = ? AND p.period = ?
+                ON CONFLICT (user_id, period, type, category) {COPY_POLICIES[policy]}
                 """,
-                (user_id, from_period)
+                (*[value for period in targets for value in (period, *period_parts(period))], user_id, from_period)
             )
-            plans = self.cursor.fetchall()
-            for plan in plans:
-                self.cursor.execute(
-                    """
-                    INSERT INTO plans (user_id, period, type, category, amount, recurrence, due, custom_period)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (user_id, to_period, *plan)
-                )
-            self.conn.commit()
-            log_info(user_id, f"Copied plan from {from_period} to {to_period}")
+            copied = self.cursor.rowcount
+            self.write_occurrences(f"user_id = ? AND period IN ({', '.join(['?'] * len(targets))})", (user_id, *targets))
+            months = [year * 100 + month for year, month in map(period_parts, targets) if year and month]
+            if months:
+                self.reflag_transactions(user_id, min(months) * 100, max(months) * 100 + 99)
+            self.commit()
+            self.invalidate_plan_horizon(user_id)
+            log_info(user_id, f"Copied plan from {from_period} to {', '.join(targets)} ({policy}): {copied} rows")
             return True
         except sqlite3.Error as e:
             log_error(user_id, f"Copy plan failed: {str(e)}")
             return False
 
-    def has_december_plan(self, user_id, year):
-        """Check if a plan exists for December of the given year."""
+    def write_occurrences(self, where, params):
+        """Regenerate the plan_occurrences due dates of the plans matching a WHERE clause."""
+        self.cursor.execute(
+            f"SELECT id, user_id, recurrence, due, custom_period, year, month FROM plans WHERE {where}", params
+        )
+        plans = self.cursor.fetchall()
+        self.cursor.execute(f"DELETE FROM plan_occurrences WHERE plan_id IN (SELECT id FROM plans WHERE {where})", params)
+        rows = []
+        for plan_id, user_id, recurrence, due, custom_period, year, month in plans:
+            if year is None or recurrence in (None, "None"):
+                continue
+            try:
+                keys = plan_due_keys(recurrence, due, custom_period, year, month)
+            except ValueError as e:
+                log_error(user_id, f"Skipping occurrences of plan {plan_id}: {str(e)}")
+                continue
+            rows.extend((plan_id, user_id, key) for key in keys)
+        self.cursor.executemany("INSERT INTO plan_occurrences (plan_id, user_id, due_key) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    @writes
+    def rebuild_occurrences(self, user_id=None):
+        """Recompute plan_occurrences from plans for one user, or for everyone."""
+        if user_id:
+            self.cursor.execute("DELETE FROM plan_occurrences WHERE user_id = ?", (user_id,))
+            count = self.write_occurrences("user_id = ?", (user_id,))
+        else:
+            self.cursor.execute("DELETE FROM plan_occurrences")
+            count = self.write_occurrences("1", ())
+        self.commit()
+        log_info(user_id or 0, f"Rebuilt plan occurrences: {count} rows")
+
+    def get_due(self, user_id, start_key, end_key):
+        """Return (due_key, type, category, amount, recurrence, period) rows for plans falling due between two YYYYMMDD keys."""
         try:
-            self.cursor.execute(
-                "SELECT COUNT(*) FROM plans WHERE user_id = ? AND period = ?",
-                (user_id, f"December {year}")
+            rows = self.fetchall(
+                """
+                SELECT o.due_key, p.type, p.category, p.amount, p.recurrence, p.period
+                FROM plan_occurrences o
+                JOIN plans p ON p.id = o.plan_id
+                WHERE o.user_id = ? AND o.due_key BETWEEN ? AND ?
+                ORDER BY o.due_key, p.type, p.category
+                """,
+                (user_id, start_key, end_key)
             )
-            count = self.cursor.fetchone()[0]
-            log_debug(user_id, f"Checked December {year} plan: {'exists' if count > 0 else 'not found'}")
-            return count > 0
+            log_debug(user_id, "Retrieved %s due plans for %s-%s", len(rows), start_key, end_key)
+            return rows
         except sqlite3.Error as e:
-            log_error(user_id, f"Error checking December plan: {str(e)}")
-            return False
+            log_error(user_id, f"Error retrieving due plans: {str(e)}")
+            return []
+
+    def plan_horizon(self, user_id):
+        """Return (max planned year or None, frozenset of planned periods) for a user, cached until plans change."""
+        horizon = self.plan_horizons.get(user_id)
+        if horizon is not None:
+            return horizon
+        try:
+            periods = frozenset(row[0] for row in self.fetchall(
+                "SELECT DISTINCT period FROM plans WHERE user_id = ?", (user_id,)
+            ))
+        except sqlite3.Error as e:
+            log_error(user_id, f"Error loading plan horizon: {str(e)}")
+            return None, frozenset()
+        years = [int(period.split()[-1]) for period in periods if period.split()[-1].isdigit()]
+        horizon = (max(years) if years else None, periods)
+        self.plan_horizons[user_id] = horizon
+        log_debug(user_id, "Loaded plan horizon: %s periods up to %s", len(periods), horizon[0])
+        return horizon
+
+    def data_version(self, user_id):
+        """Return a counter that changes whenever the user's data may have changed."""
+        return self.data_versions.get(user_id, 0)
+
+    def bump_data_version(self, user_id):
+        self.data_versions[user_id] = self.data_versions.get(user_id, 0) + 1
+
+    def invalidate_plan_horizon(self, user_id):
+        """Forget the cached plan horizon after a user's plans change."""
+        self.plan_horizons.pop(user_id, None)
+
+    def has_december_plan(self, user_id, year):
+        """Check if a plan exists for December of the given year."""
+        return f"December {year}" in self.plan_horizon(user_id)[1]
 
     def get_plan_amount(self, user_id, period, type, category):
         """Get the amount for a specific plan."""
         try:
-            self.cursor.execute(
+            result = self.fetchone(
                 """
                 SELECT amount
                 FROM plans
@@ -505,9 +1102,8 @@ class Database:
                 """,
                 (user_id, period, type, category)
             )
-            result = self.cursor.fetchone()
             amount = result[0] if result else None
-            log_debug(user_id, f"Retrieved amount for {period}, {type}/{category}: {amount}")
+            log_debug(user_id, "Retrieved amount for %s, %s/%s: %s", period, type, category, amount)
             return amount
         except sqlite3.Error as e:
             log_error(user_id, f"Error retrieving plan amount: {str(e)}")
@@ -516,7 +1112,7 @@ class Database:
     def get_plan_details(self, user_id, period, type, category):
         """Get all details for a specific plan."""
         try:
-            self.cursor.execute(
+            result = self.fetchone(
                 """
                 SELECT amount, recurrence, due, custom_period
                 FROM plans
@@ -524,7 +1120,6 @@ class Database:
                 """,
                 (user_id, period, type, category)
             )
-            result = self.cursor.fetchone()
             if result:
                 details = {
                     "amount": result[0],
@@ -532,122 +1127,441 @@ class Database:
                     "due": result[2],
                     "custom_period": result[3]
                 }
-                log_debug(user_id, f"Retrieved plan details for {period}, {type}/{category}: {details}")
+                log_debug(user_id, "Retrieved plan details for %s, %s/%s: %s", period, type, category, details)
                 return details
-            log_debug(user_id, f"No plan details found for {period}, {type}/{category}")
+            log_debug(user_id, "No plan details found for %s, %s/%s", period, type, category)
             return None
         except sqlite3.Error as e:
             log_error(user_id, f"Error retrieving plan details: {str(e)}")
             return None
 
-    def get_transactions(self, user_id, date_filter, start_date=None, end_date=None):
-        """Retrieve transactions based on a date filter."""
+    def adjust_rollup(self, user_id, transaction_date_key, type, category, mode, amount, count):
+        """Add a transaction's amount and count (negative to remove it) to its monthly rollup row."""
+        month = transaction_date_key // 100
+        self.cursor.execute(
+            """
+            INSERT INTO monthly_rollups (user_id, month, type, category, mode, total, count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, month, type, category, mode)
+            DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+            """,
+            (user_id, month, type, category, mode, amount, count)
+        )
+        self.cursor.execute(
+            "DELETE FROM monthly_rollups WHERE user_id = ? AND month = ? AND type = ? AND category = ? AND mode = ? AND count <= 0",
+            (user_id, month, type, category, mode)
+        )
+
+    def move_rollups(self, user_id, old_type, old_category, new_type, new_category):
+        """Merge a renamed category's rollup rows into the new type/category."""
+        self.cursor.execute(
+            """
+            INSERT INTO monthly_rollups (user_id, month, type, category, mode, total, count)
+            SELECT user_id, month, ?, ?, mode, total, count
+            FROM monthly_rollups
+            WHERE user_id = ? AND type = ? AND category = ?
+            ON CONFLICT (user_id, month, type, category, mode)
+            DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+            """,
+            (new_type, new_category, user_id, old_type, old_category)
+        )
+        self.cursor.execute(
+            "DELETE FROM monthly_rollups WHERE user_id = ? AND type = ? AND category = ?",
+            (user_id, old_type, old_category)
+        )
+
+    @writes
+    def rebuild_rollups(self, user_id=None):
+        """Recompute monthly_rollups from transactions for one user, or for everyone."""
+        where, params = ("WHERE user_id = ?", (user_id,)) if user_id else ("", ())
+        self.cursor.execute(f"DELETE FROM monthly_rollups {where}", params)
+        self.cursor.execute(
+            f"""
+            INSERT INTO monthly_rollups (user_id, month, type, category, mode, total, count)
+            SELECT user_id, date_key / 100, type, category, mode, SUM(amount), COUNT(*)
+            FROM transactions
+            {where + " AND" if where else "WHERE"} date_key IS NOT NULL
+            GROUP BY user_id, date_key / 100, type, category, mode
+            """,
+            params
+        )
+        self.commit()
+        log_info(user_id or 0, f"Rebuilt monthly rollups: {self.cursor.rowcount} rows")
+
+    def verify_rollups(self, user_id=None):
+        """Return (user_id, month, type, category, mode) keys whose rollup row disagrees with transactions."""
+        where, params = ("WHERE user_id = ?", (user_id,)) if user_id else ("", ())
+        expected = f"""
+            SELECT user_id, date_key / 100, type, category, mode, SUM(amount), COUNT(*)
+            FROM transactions
+            {where + " AND" if where else "WHERE"} date_key IS NOT NULL
+            GROUP BY user_id, date_key / 100, type, category, mode
+        """
+        actual = f"SELECT user_id, month, type, category, mode, total, count FROM monthly_rollups {where}"
         try:
-            query = "SELECT id, date, type, category, amount, mode, details, flagged FROM transactions WHERE user_id = ?"
+            rows = self.fetchall(
+                f"SELECT * FROM ({expected} EXCEPT {actual}) UNION SELECT * FROM ({actual} EXCEPT {expected})",
+                params * 4
+            )
+            mismatches = sorted({row[:5] for row in rows})
+            if mismatches:
+                log_error(user_id or 0, f"Monthly rollups out of date for {len(mismatches)} keys")
+            else:
+                log_info(user_id or 0, "Monthly rollups verified")
+            return mismatches
+        except sqlite3.Error as e:
+            log_error(user_id or 0, f"Error verifying rollups: {str(e)}")
+            return []
+
+    def get_date_range(self, date_filter, start_date=None, end_date=None):
+        """Return inclusive (start, end) date_key bounds for a date filter, or None for all dates."""
+        today = datetime.now()
+        if date_filter in ("Today", "Day"):
+            return date_key(today), date_key(today)
+        if date_filter == "Week":
+            week_start = today - timedelta(days=today.weekday())
+            return date_key(week_start), date_key(week_start + timedelta(days=6))
+        if date_filter == "Month":
+            month_base = today.year * 10000 + today.month * 100
+            return month_base + 1, month_base + 31
+        if date_filter == "Year":
+            return today.year * 10000 + 101, today.year * 10000 + 1231
+        if date_filter == "Range" and start_date and end_date:
+            return (date_key(datetime.strptime(start_date, "%m/%d/%Y")),
+                    date_key(datetime.strptime(end_date, "%m/%d/%Y")))
+        return None
+
+    def get_transactions(self, user_id, date_filter, start_date=None, end_date=None, limit=None, after=None):
+        """Retrieve transactions based on a date filter, newest first, each row ending with its date_key.
+
+        Pass the (date_key, id) of the last row already shown as `after` to fetch the next page.
+        """
+        try:
+            query = "SELECT id, date, type, category, amount, mode, details, flagged, date_key FROM transactions WHERE user_id = ?"
             params = [user_id]
-            if date_filter == "Today":
-                query += " AND date = ?"
-                params.append(datetime.now().strftime("%b %d %Y"))
-            elif date_filter == "Week":
-                query += " AND date >= ? AND date <= ?"
-                params.extend([self.get_week_start(), self.get_week_end()])
-            elif date_filter == "Month":
-                query += " AND date LIKE ?"
-                params.append(f"{datetime.now().strftime('%b')} % {datetime.now().year}")
-            elif date_filter == "Year":
-                query += " AND date LIKE ?"
-                params.append(f"% {datetime.now().year}")
-            elif date_filter == "Range" and start_date and end_date:
-                start_date_converted = datetime.strptime(start_date, "%m/%d/%Y").strftime("%b %d %Y")
-                end_date_converted = datetime.strptime(end_date, "%m/%d/%Y").strftime("%b %d %Y")
-                query += " AND date >= ? AND date <= ?"
-                params.extend([start_date_converted, end_date_converted])
-            query += " ORDER BY date DESC"
-            self.cursor.execute(query, params)
-            transactions = self.cursor.fetchall()
-            log_debug(user_id, f"Retrieved {len(transactions)} transactions for filter {date_filter}")
+            date_range = self.get_date_range(date_filter, start_date, end_date)
+            if date_range:
+                query += " AND date_key BETWEEN ? AND ?"
+                params.extend(date_range)
+            if after:
+                query += " AND (date_key, id) < (?, ?)"
+                params.extend(after)
+            query += " ORDER BY date_key DESC, id DESC"
+            if limit:
+                query += " LIMIT ?"
+                params.append(limit)
+            transactions = self.fetchall(query, params)
+            log_debug(user_id, "Retrieved %s transactions for filter %s", len(transactions), date_filter)
             return transactions
         except sqlite3.Error as e:
             log_error(user_id, f"Error retrieving transactions: {str(e)}")
             return []
 
+    def get_transaction_cursor(self, user_id, date_filter, start_date=None, end_date=None, offset=0):
+        """Return the (date_key, id) of the transaction at `offset` in get_transactions order, or None."""
+        try:
+            query = "SELECT date_key, id FROM transactions WHERE user_id = ?"
+            params = [user_id]
+            date_range = self.get_date_range(date_filter, start_date, end_date)
+            if date_range:
+                query += " AND date_key BETWEEN ? AND ?"
+                params.extend(date_range)
+            query += " ORDER BY date_key DESC, id DESC LIMIT 1 OFFSET ?"
+            params.append(offset)
+            return self.fetchone(query, params)
+        except sqlite3.Error as e:
+            log_error(user_id, f"Error seeking transactions: {str(e)}")
+            return None
+
+    def iter_export(self, user_id, table, start_key=None, end_key=None, batch_size=1000):
+        """Yield batches of a user's rows from an EXPORT_TABLES table, optionally limited to a YYYYMMDD range."""
+        columns, (key_sql, divisor, whole_year_sql), order = EXPORT_TABLES[table]
+        query = f"SELECT {', '.join(name for name, kind in columns)} FROM {table} WHERE user_id = ?"
+        params = [user_id]
+        if start_key is not None and end_key is not None:
+            if whole_year_sql:
+                # Whole-year rows (plans for a "Total Year" period) overlap any range within their year
+                query += f" AND ({key_sql} BETWEEN ? AND ? OR ({whole_year_sql} AND year BETWEEN ? AND ?))"
+                params += [start_key // divisor, end_key // divisor, start_key // 10000, end_key // 10000]
+            else:
+                query += f" AND {key_sql} BETWEEN ? AND ?"
+                params += [start_key // divisor, end_key // divisor]
+        query += f" ORDER BY {order}"
+        log_debug(user_id, "Exporting %s in batches of %s", table, batch_size)
+        yield from self.iter_rows(query, params, batch_size)
+
+    def summarize(self, user_id, date_filter, start_date=None, end_date=None):
+        """Return Cash and Mpesa balances, totals by type and totals by type and category for a date filter."""
+        summary = {
+            "balances": {"Cash": 0, "Mpesa": 0},
+            "totals": {"Income": 0, "Expenses": 0, "Savings": 0},
+            "categories": {"Income": {}, "Expenses": {}, "Savings": {}},
+            "count": 0,
+        }
+        try:
+            date_range = self.get_date_range(date_filter, start_date, end_date)
+            # Whole-month filters (All, Month, Year) are served from the rollups
+            if date_range is None or (date_range[0] % 100 == 1 and date_range[1] % 100 == 31):
+                query = "SELECT type, category, mode, SUM(total), SUM(count) FROM monthly_rollups WHERE user_id = ?"
+                params = [user_id]
+                if date_range:
+                    query += " AND month BETWEEN ? AND ?"
+                    params.extend([date_range[0] // 100, date_range[1] // 100])
+            else:
+                query = "SELECT type, category, mode, SUM(amount), COUNT(*) FROM transactions WHERE user_id = ? AND date_key BETWEEN ? AND ?"
+                params = [user_id, *date_range]
+            rows = self.fetchall(query + " GROUP BY type, category, mode", params)
+            for type, category, mode, amount, count in rows:
+                bucket = type if type in summary["totals"] else "Savings"
+                summary["totals"][bucket] += amount
+                summary["categories"][bucket][category] = summary["categories"][bucket].get(category, 0) + amount
+                account = "Cash" if mode == "Cash" else "Mpesa"  # anything not paid in cash, e.g. imported modes
+                summary["balances"][account] += amount if type == "Income" else -amount
+                summary["count"] += count
+            log_debug(user_id, "Summarized %s transactions for filter %s", summary['count'], date_filter)
+        except sqlite3.Error as e:
+            log_error(user_id, f"Error summarizing transactions: {str(e)}")
+        return summary
+
     def get_recent_transactions(self, user_id, limit=5):
         """Retrieve recent transactions for a user."""
         try:
-            self.cursor.execute(
-                "SELECT date, type, category, amount, mode, details FROM transactions WHERE user_id = ? ORDER BY date DESC LIMIT ?",
+            transactions = self.fetchall(
+                "SELECT date, type, category, amount, mode, details FROM transactions WHERE user_id = ? ORDER BY date_key DESC, id DESC LIMIT ?",
                 (user_id, limit)
             )
-            transactions = self.cursor.fetchall()
-            log_debug(user_id, f"Retrieved {len(transactions)} recent transactions")
+            log_debug(user_id, "Retrieved %s recent transactions", len(transactions))
             return transactions
         except sqlite3.Error as e:
             log_error(user_id, f"Error retrieving recent transactions: {str(e)}")
             return []
 
-    def get_monthly_trends(self, user_id, months=6):
-        """Retrieve monthly financial trends for a user."""
+    def get_trends(self, user_id, bucket, start=None, end=None, zero_fill=True):
+        """Retrieve per-bucket income, expenses, savings and balance between two dates in one grouped query."""
+        if bucket not in TREND_BUCKETS:
+            log_error(user_id, f"Unsupported trend bucket: {bucket}")
+            return []
         try:
-            trends = []
-            current_date = datetime.now()
-            for i in range(months):
-                month = (current_date.month - i - 1) % 12 + 1
-                year = current_date.year - (1 if current_date.month - i - 1 < 1 else 0)
-                month_str = datetime(year, month, 1).strftime("%b %Y")
-                self.cursor.execute(
-                    "SELECT type, SUM(amount) FROM transactions WHERE user_id = ? AND date LIKE ? GROUP BY type",
-                    (user_id, f"{month_str}%")
+            end = end or datetime.now()
+            end = end.date() if isinstance(end, datetime) else end
+            start = start or end - DEFAULT_TREND_SPANS[bucket]
+            start = bucket_start(bucket, start.date() if isinstance(start, datetime) else start)
+            key_sql, rollup_key_sql, label_format = TREND_BUCKETS[bucket]
+            if rollup_key_sql:
+                rows = self.fetchall(
+                    f"""
+                    SELECT {rollup_key_sql} AS bucket,
+                           SUM(CASE WHEN type = 'Income' THEN total ELSE 0 END),
+                           SUM(CASE WHEN type = 'Expenses' THEN total ELSE 0 END),
+                           SUM(CASE WHEN type = 'Savings' THEN total ELSE 0 END)
+                    FROM monthly_rollups
+                    WHERE user_id = ? AND month BETWEEN ? AND ?
+                    GROUP BY bucket
+                    """,
+                    (user_id, date_key(start) // 100, date_key(end) // 100)
                 )
-                result = dict(self.cursor.fetchall())
-                income = result.get("Income", 0)
-                expenses = result.get("Expenses", 0)
-                savings = result.get("Savings", 0)
-                balance = income - expenses - savings
-                trends.append((month_str, income, expenses, savings, balance))
-            log_debug(user_id, f"Retrieved trends for {months} months")
-            return trends[::-1]
+            else:
+                rows = self.fetchall(
+                    f"""
+                    SELECT {key_sql} AS bucket,
+                           SUM(CASE WHEN type = 'Income' THEN amount ELSE 0 END),
+                           SUM(CASE WHEN type = 'Expenses' THEN amount ELSE 0 END),
+                           SUM(CASE WHEN type = 'Savings' THEN amount ELSE 0 END)
+                    FROM transactions
+                    WHERE user_id = ? AND date_key BETWEEN ? AND ?
+                    GROUP BY bucket
+                    """,
+                    (user_id, date_key(start), date_key(end))
+                )
+            totals = {row[0]: row[1:] for row in rows}
+            if zero_fill:
+                keys = []
+                current = start
+                while current <= end:
+                    keys.append(bucket_key(bucket, current))
+                    current = next_bucket(bucket, current)
+            else:
+                keys = sorted(totals)
+            trends = []
+            for key in keys:
+                income, expenses, savings = totals.get(key, (0, 0, 0))
+                label = bucket_date(bucket, key).strftime(label_format)
+                trends.append((label, income, expenses, savings, income - expenses - savings))
+            log_debug(user_id, "Retrieved %s %s trend buckets from %s to %s", len(trends), bucket, start, end)
+            return trends
         except sqlite3.Error as e:
-            log_error(user_id, f"Error retrieving monthly trends: {str(e)}")
+            log_error(user_id, f"Error retrieving {bucket} trends: {str(e)}")
             return []
 
+    def get_daily_trends(self, user_id, days=7):
+        """Retrieve daily trends for the last `days` days."""
+        today = datetime.now().date()
+        return self.get_trends(user_id, "day", today - timedelta(days=days - 1), today)
+
+    def get_weekly_trends(self, user_id, weeks=8):
+        """Retrieve weekly (Monday-based) trends for the last `weeks` weeks."""
+        today = datetime.now().date()
+        return self.get_trends(user_id, "week", today - timedelta(weeks=weeks - 1), today)
+
+    def get_monthly_trends(self, user_id, months=6):
+        """Retrieve monthly trends for the last `months` months, up to MAX_TREND_MONTHS."""
+        months = max(1, min(int(months), MAX_TREND_MONTHS))
+        today = datetime.now().date()
+        year, month = divmod(today.year * 12 + today.month - months, 12)
+        return self.get_trends(user_id, "month", today.replace(year=year, month=month + 1, day=1), today)
+
+    def get_yearly_trends(self, user_id, years=5):
+        """Retrieve yearly trends for the last `years` years."""
+        today = datetime.now().date()
+        return self.get_trends(user_id, "year", today.replace(year=today.year - years + 1, month=1, day=1), today)
+
+    @writes
     def add_transaction(self, user_id, date, type, category, amount, mode, details):
         """Add a new transaction for a user."""
+        try:
+            transaction_date_key = date_key(date)
+        except ValueError as e:
+            log_error(user_id, f"Add transaction failed, invalid date {date!r}: {str(e)}")
+            return False
         try:
             self.cursor.execute(
-                "SELECT 1 FROM plans WHERE user_id = ? AND type = ? AND category = ? AND period = ?",
-                (user_id, type, category, datetime.now().strftime("%B %Y"))
+                "SELECT 1 FROM plans WHERE user_id = ? AND year = ? AND month = ? AND type = ? AND category = ?",
+                (user_id, transaction_date_key // 10000, transaction_date_key // 100 % 100, type, category)
             )
             flagged = 0 if self.cursor.fetchone() else 1
             self.cursor.execute(
-                "INSERT INTO transactions (user_id, date, type, category, amount, mode, details, flagged) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (user_id, date, type, category, amount, mode, details, flagged)
+                "INSERT INTO transactions (user_id, date, type, category, amount, mode, details, flagged, date_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, date, type, category, amount, mode, details, flagged, transaction_date_key)
             )
+            self.adjust_rollup(user_id, transaction_date_key, type, category, mode, amount, 1)
             self.add_category(user_id, type, category)
-            self.conn.commit()
+            self.commit()
             log_info(user_id, f"Added transaction: {date}, {type}/{category}, KSh {amount}")
             return True
         except sqlite3.Error as e:
             log_error(user_id, f"Add transaction failed: {str(e)}")
             return False
 
+    def transaction_counts(self, user_id, start_key, end_key):
+        """Return {(date_key, type, category, amount, mode, details): count} of a user's transactions in a YYYYMMDD range."""
+        try:
+            rows = self.fetchall(
+                """
+                SELECT date_key, type, category, amount, mode, details, COUNT(*) FROM transactions
+                WHERE user_id = ? AND date_key BETWEEN ? AND ?
+                GROUP BY date_key, type, category, amount, mode, details
+                """,
+                (user_id, start_key, end_key)
+            )
+            return {tuple(row[:-1]): row[-1] for row in rows}
+        except sqlite3.Error as e:
+            log_error(user_id, f"Error counting stored transactions: {str(e)}")
+            return {}
+
+    @writes
+    def add_transactions(self, user_id, rows):
+        """Add many (date, type, category, amount, mode, details) transactions in one transaction."""
+        try:
+            keyed = [(date_key(row[0]), *row) for row in rows]
+        except ValueError as e:
+            log_error(user_id, f"Bulk add transactions failed, invalid date: {str(e)}")
+            return False
+        try:
+            records = []
+            rollups = {}
+            for key, date, type, category, amount, mode, details in keyed:
+                records.append((user_id, date, type, category, amount, mode, details, 1, key))
+                total, count = rollups.get((key // 100, type, category, mode), (0, 0))
+                rollups[(key // 100, type, category, mode)] = (total + amount, count + 1)
+            self.cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM transactions")
+            first_id = self.cursor.fetchone()[0]
+            self.cursor.executemany(
+                "INSERT INTO transactions (user_id, date, type, category, amount, mode, details, flagged, date_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                records
+            )
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO categories (user_id, type, category) VALUES (?, ?, ?)",
+                [(user_id, type, category) for type, category in {(row[1], row[2]) for row in rows}]
+            )
+            self.cursor.executemany(
+                """
+                INSERT INTO monthly_rollups (user_id, month, type, category, mode, total, count)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, month, type, category, mode)
+                DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+                """,
+                [(user_id, *rollup_key, total, count) for rollup_key, (total, count) in rollups.items()]
+            )
+            keys = [record[-1] for record in records]
+            self.reflag_transactions(user_id, min(keys, default=0), max(keys, default=0), since_id=first_id)
+            self.commit()
+            log_info(user_id, f"Added {len(records)} transactions in bulk")
+            return True
+        except (sqlite3.Error, ValueError) as e:
+            if self.pool.batch_depth == 0:
+                self.conn.rollback()
+            log_error(user_id, f"Bulk add transactions failed: {str(e)}")
+            return False
+
+    @writes
+    def reflag_transactions(self, user_id, start_key=None, end_key=None, since_id=None):
+        """Recompute flagged for a user's transactions, optionally within a YYYYMMDD range or from an id.
+
+        A transaction is flagged when no plan exists for its type and category in its own month.
+        Returns the number of transactions whose flag changed.
+        """
+        where = "user_id = ?"
+        params = [user_id]
+        if start_key is not None and end_key is not None:
+            where += " AND date_key BETWEEN ? AND ?"
+            params += [start_key, end_key]
+        if since_id is not None:
+            where += " AND id >= ?"
+            params.append(since_id)
+        try:
+            # flagged = EXISTS(plan) is exactly the set of rows whose flag is wrong, so flip those
+            self.cursor.execute(
+                f"""
+                UPDATE transactions SET flagged = 1 - flagged
+                WHERE {where} AND flagged = EXISTS (
+                    SELECT 1 FROM plans p
+                    WHERE p.user_id = transactions.user_id
+                    AND p.year = transactions.date_key / 10000
+                    AND p.month = transactions.date_key / 100 % 100
+                    AND p.type = transactions.type AND p.category = transactions.category
+                )
+                """,
+                params
+            )
+            changed = self.cursor.rowcount
+            self.commit()
+            log_debug(user_id, "Reflagged transactions %s-%s: %s changed", start_key, end_key, changed)
+            return changed
+        except sqlite3.Error as e:
+            log_error(user_id, f"Reflag transactions failed: {str(e)}")
+            return 0
+
+    @writes
     def delete_transaction(self, user_id, transaction_id):
         """Delete a transaction and store it in deleted_transactions."""
         try:
             self.cursor.execute(
-                "SELECT id, date, type, category, amount, mode, details, flagged FROM transactions WHERE user_id = ? AND id = ?",
+                "SELECT id, date, type, category, amount, mode, details, flagged, date_key FROM transactions WHERE user_id = ? AND id = ?",
                 (user_id, transaction_id)
             )
             transaction = self.cursor.fetchone()
             if transaction:
                 self.cursor.execute(
-                    "INSERT INTO deleted_transactions (user_id, transaction_id, date, type, category, amount, mode, details, flagged) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    "INSERT INTO deleted_transactions (user_id, transaction_id, date, type, category, amount, mode, details, flagged, date_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
                     (user_id, transaction[0], *transaction[1:])
                 )
                 self.cursor.execute(
                     "DELETE FROM transactions WHERE user_id = ? AND id = ?",
                     (user_id, transaction_id)
                 )
-                self.conn.commit()
+                _, _, type, category, amount, mode, _, _, transaction_date_key = transaction
+                self.adjust_rollup(user_id, transaction_date_key, type, category, mode, -amount, -1)
+                self.commit()
                 log_info(user_id, f"Deleted transaction: ID {transaction_id}")
                 return True
             log_error(user_id, f"Transaction ID {transaction_id} not found")
@@ -656,24 +1570,29 @@ class Database:
             log_error(user_id, f"Delete transaction failed: {str(e)}")
             return False
 
+    @writes
     def undo_delete(self, user_id):
         """Undo the last deleted transaction."""
         try:
             self.cursor.execute(
-                "SELECT transaction_id, date, type, category, amount, mode, details, flagged FROM deleted_transactions WHERE user_id = ? ORDER BY deleted_at DESC LIMIT 1",
+                "SELECT transaction_id, date, type, category, amount, mode, details, flagged, date_key FROM deleted_transactions WHERE user_id = ? ORDER BY deleted_at DESC LIMIT 1",
                 (user_id,)
             )
             transaction = self.cursor.fetchone()
             if transaction:
                 self.cursor.execute(
-                    "INSERT INTO transactions (id, user_id, date, type, category, amount, mode, details, flagged) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    "INSERT INTO transactions (id, user_id, date, type, category, amount, mode, details, flagged, date_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
                     (transaction[0], user_id, *transaction[1:])
                 )
                 self.cursor.execute(
                     "DELETE FROM deleted_transactions WHERE user_id = ? AND transaction_id = ?",
                     (user_id, transaction[0])
                 )
-                self.conn.commit()
+                _, _, type, category, amount, mode, _, _, transaction_date_key = transaction
+                self.adjust_rollup(user_id, transaction_date_key, type, category, mode, amount, 1)
+                # Plans may have changed since the delete
+                self.reflag_transactions(user_id, transaction_date_key, transaction_date_key, since_id=transaction[0])
+                self.commit()
                 log_info(user_id, f"Undid deletion of transaction: ID {transaction[0]}")
                 return True
             log_error(user_id, "No transaction to undo")
@@ -695,6 +1614,6 @@ class Database:
         return (today + timedelta(days=6 - today.weekday())).strftime("%b %d %Y")
 
     def close(self):
-        """Close the database connection."""
-        self.conn.close()
+        """Close the shared connection pool."""
+        self.pool.close()
         log_info(0, "Database connection closed")
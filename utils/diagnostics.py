@@ -0,0 +1,193 @@
+import re
+import sys
+import argparse
+from datetime import datetime, timedelta
+from utils.database import Database, ConnectionPool, date_key
+from utils.sqltrace import SqlTracer
+
+SAMPLE_PASSWORD = "Sample#Pass1"
+# Names a CTE in "WITH [RECURSIVE] name [(columns)] AS (" or a later ", name AS ("
+CTE_NAME = re.compile(r"(?:\bWITH(?:\s+RECURSIVE)?|,)\s+(\w+)(?:\s*\([^()]*\))?\s+AS\s*(?:NOT\s+)?(?:MATERIALIZED\s+)?\(", re.IGNORECASE)
+# A table or CTE named in FROM, JOIN or a comma join, with its alias if it has one
+TABLE_REF = re.compile(r"(?:\bFROM|\bJOIN|,)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+# SCAN targets that are not tables: VALUES rows, or a subquery's result
+SCAN_ALLOWED = re.compile(r"^SCAN (?:CONSTANT ROW|\d+ CONSTANT ROWS|\(subquery-\d+\)|SUBQUERY \d+)", re.IGNORECASE)
+
+def exercise_queries(db, user_id):
+    """Yield (method name, callable) pairs covering every Database query method."""
+    today = datetime.now()
+    date_str = today.strftime("%b %d %Y")
+    period = today.strftime("%B %Y")
+    range_start = today.replace(day=1).strftime("%m/%d/%Y")
+    range_end = today.strftime("%m/%d/%Y")
+    return [
+        ("login", lambda: db.login("plan_check", SAMPLE_PASSWORD)),
+        ("get_logged_in_user", lambda: db.get_logged_in_user()),
+        ("username_exists", lambda: db.username_exists("plan_check", user_id)),
+        ("email_exists", lambda: db.email_exists("plan_check@example.com", user_id)),
+        ("load_user", lambda: (db.invalidate_user(user_id), db.load_user(user_id))),
+        ("get_user_profile", lambda: db.get_user_profile(user_id)),
+        ("update_user_profile", lambda: db.update_user_profile(user_id, "plan_check", "plan_check@example.com", "")),
+        ("get_settings", lambda: db.get_settings(user_id)),
+        ("update_settings", lambda: db.update_settings(user_id, "KSh", "Unallocated as Savings", 1, "Light", 1, "English")),
+        ("is_planning_enabled", lambda: db.is_planning_enabled(user_id)),
+        ("add_category", lambda: db.add_category(user_id, "Expenses", "Rent")),
+        ("get_categories", lambda: db.get_categories(user_id, "Expenses")),
+        ("update_category", lambda: db.update_category(user_id, "Expenses", "Rent", "Expenses", "Housing")),
+        ("add_plan", lambda: db.add_plan(user_id, period, "Income", "Salary", 100, "None", "")),
+        ("add_plan_custom", lambda: db.add_plan(user_id, period, "Expenses", "Rent", 100, "Custom", "", '{"type":"nth_weekday","weekday":"monday","nth":1}')),
+        ("get_plans", lambda: db.get_plans(user_id, period)),
+        ("get_plans_total", lambda: db.get_plans(user_id, f"Total {today.year}")),
+        ("get_plan_totals_quarter", lambda: db.get_plan_totals(user_id, today.year, quarter=(today.month + 2) // 3)),
+        ("get_plan_totals_years", lambda: db.get_plan_totals(user_id, today.year, today.year + 2)),
+        ("get_variance_month", lambda: db.get_variance(user_id, today.year, month=today.month)),
+        ("get_variance_year", lambda: db.get_variance(user_id, today.year)),
+        ("get_plan_amount", lambda: db.get_plan_amount(user_id, period, "Income", "Salary")),
+        ("get_plan_details", lambda: db.get_plan_details(user_id, period, "Income", "Salary")),
+        ("plan_horizon", lambda: (db.invalidate_plan_horizon(user_id), db.plan_horizon(user_id))),
+        ("has_december_plan", lambda: db.has_december_plan(user_id, today.year)),
+        ("copy_plan", lambda: db.copy_plan(user_id, period, f"December {today.year + 1}")),
+        ("copy_plan_add", lambda: db.copy_plan(user_id, period, [f"{month} {today.year + 1}" for month in ("January", "February", "December")], "add")),
+        ("add_transaction", lambda: db.add_transaction(user_id, date_str, "Income", "Salary", 100, "Cash", "")),
+        ("add_transactions", lambda: db.add_transactions(user_id, [(date_str, "Expenses", "Airtime", 50, "Mpesa", "")] * 3)),
+        ("transaction_counts", lambda: db.transaction_counts(user_id, date_key(today), date_key(today))),
+        ("get_due", lambda: db.get_due(user_id, date_key(today), date_key(today + timedelta(days=7)))),
+        ("get_transactions", lambda: db.get_transactions(user_id, "All")),
+        ("get_transactions_today", lambda: db.get_transactions(user_id, "Today")),
+        ("get_transactions_week", lambda: db.get_transactions(user_id, "Week")),
+        ("get_transactions_month", lambda: db.get_transactions(user_id, "Month")),
+        ("get_transactions_year", lambda: db.get_transactions(user_id, "Year")),
+        ("get_transactions_range", lambda: db.get_transactions(user_id, "Range", range_start, range_end)),
+        ("get_transactions_page", lambda: db.get_transactions(user_id, "Year", limit=50, after=(date_key(today), 10))),
+        ("get_transaction_cursor", lambda: db.get_transaction_cursor(user_id, "All", offset=100)),
+        ("iter_export_transactions", lambda: list(db.iter_export(user_id, "transactions", date_key(today), date_key(today)))),
+        ("iter_export_plans", lambda: list(db.iter_export(user_id, "plans"))),
+        ("iter_export_rollups", lambda: list(db.iter_export(user_id, "monthly_rollups", date_key(today), date_key(today)))),
+        ("summarize_all", lambda: db.summarize(user_id, "All")),
+        ("summarize_month", lambda: db.summarize(user_id, "Month")),
+        ("summarize_week", lambda: db.summarize(user_id, "Week")),
+        ("get_recent_transactions", lambda: db.get_recent_transactions(user_id)),
+        ("get_daily_trends", lambda: db.get_daily_trends(user_id)),
+        ("get_weekly_trends", lambda: db.get_weekly_trends(user_id)),
+        ("get_monthly_trends", lambda: db.get_monthly_trends(user_id)),
+        ("get_yearly_trends", lambda: db.get_yearly_trends(user_id)),
+        ("reflag_transactions", lambda: db.reflag_transactions(user_id, date_key(today.replace(day=1)), date_key(today))),
+        ("reflag_transactions_all", lambda: db.reflag_transactions(user_id)),
+        ("delete_transaction", lambda: db.delete_transaction(user_id, 1)),
+        ("undo_delete", lambda: db.undo_delete(user_id)),
+        ("rebuild_rollups", lambda: db.rebuild_rollups(user_id)),
+        ("verify_rollups", lambda: db.verify_rollups(user_id)),
+        ("rebuild_occurrences", lambda: db.rebuild_occurrences(user_id)),
+        ("delete_category", lambda: db.delete_category(user_id, "Expenses", "Housing")),
+        ("logout", lambda: db.logout(user_id)),
+    ]
+
+def full_scans(db, statement):
+    """Return the EXPLAIN QUERY PLAN lines of a statement that scan a whole table.
+
+    SQLite names a scanned table by its alias if it has one, so every SCAN counts
+    except those of the statement's CTEs (by name or alias), subqueries and constant rows.
+    """
+    ctes = {name.lower() for name in CTE_NAME.findall(statement)}
+    ctes |= {alias.lower() for name, alias in TABLE_REF.findall(statement) if alias and name.lower() in ctes}
+    db.cursor.execute(f"EXPLAIN QUERY PLAN {statement}")
+    scans = []
+    for row in db.cursor.fetchall():
+        detail = row[-1]
+        words = detail.split()
+        if words[0] == "SCAN" and not SCAN_ALLOWED.match(detail) and words[1].lower() not in ctes:
+            scans.append(detail)
+    return scans
+
+def check_query_plans(db_name=":memory:"):
+    """Run every Database query method and report statements whose plan is a full table SCAN."""
+    db = Database(db_name)
+    user_id = db.signup("plan_check", "plan_check@example.com", SAMPLE_PASSWORD)
+    captured = []
+    for conn in db.pool.connections():
+        conn.set_trace_callback(captured.append)
+    statements = []
+    for name, call in exercise_queries(db, user_id):
+        del captured[:]
+        call()
+        statements.extend((name, sql) for sql in captured)
+    for conn in db.pool.connections():
+        conn.set_trace_callback(None)
+
+    regressions = []
+    for name, sql in statements:
+        if sql.split(None, 1)[0].upper() not in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+            continue
+        for detail in full_scans(db, sql):
+            regressions.append((name, " ".join(sql.split()), detail))
+    db.close()
+    return regressions
+
+def trace_queries(db_name=":memory:", slow_ms=50):
+    """Run every Database query method on traced connections and return the tracer."""
+    tracer = SqlTracer(slow_ms=slow_ms)
+    db = Database(db_name, pool=ConnectionPool(db_name, tracer=tracer))
+    user_id = db.signup("plan_check", "plan_check@example.com", SAMPLE_PASSWORD) or db.login("plan_check", SAMPLE_PASSWORD)
+    tracer.reset()  # leave out schema setup and signup
+    for name, call in exercise_queries(db, user_id):
+        call()
+    db.close()
+    return tracer
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.diagnostics", description="Penny database diagnostics")
+    commands = parser.add_subparsers(dest="command", required=True)
+    plans = commands.add_parser("query-plans", help="fail if any Database query falls back to a full table scan")
+    plans.add_argument("--db", default=":memory:", help="database file to check against; sample rows are written to it (default: fresh in-memory database)")
+    trace = commands.add_parser("sql-trace", help="time every Database statement and print per-statement histograms")
+    trace.add_argument("--db", default=":memory:", help="database file to trace against; sample rows are written to it (default: fresh in-memory database)")
+    trace.add_argument("--slow-ms", type=float, default=50, help="log statements slower than this to the slow-query log (default: 50)")
+    trace.add_argument("--limit", type=int, default=20, help="number of statements to show, slowest total first (default: 20)")
+    rebuild = commands.add_parser("rebuild-rollups", help="recompute monthly_rollups from transactions")
+    rebuild.add_argument("--db", default="penny.db", help="database file (default: penny.db)")
+    rebuild.add_argument("--user", type=int, help="only rebuild this user_id")
+    verify = commands.add_parser("verify-rollups", help="fail if monthly_rollups disagrees with transactions")
+    verify.add_argument("--db", default="penny.db", help="database file (default: penny.db)")
+    verify.add_argument("--user", type=int, help="only verify this user_id")
+    occurrences = commands.add_parser("rebuild-occurrences", help="recompute plan_occurrences due dates from plans")
+    occurrences.add_argument("--db", default="penny.db", help="database file (default: penny.db)")
+    occurrences.add_argument("--user", type=int, help="only rebuild this user_id")
+    reflag = commands.add_parser("reflag", help="recompute flagged for every transaction of a user")
+    reflag.add_argument("--db", default="penny.db", help="database file (default: penny.db)")
+    reflag.add_argument("--user", type=int, required=True, help="user_id to reflag")
+    args = parser.parse_args(argv)
+
+    if args.command == "query-plans":
+        regressions = check_query_plans(args.db)
+        for name, sql, detail in regressions:
+            print(f"{name}: {detail}\n    {sql}")
+        print(f"{len(regressions)} full table scan(s) found")
+        return 1 if regressions else 0
+    if args.command == "sql-trace":
+        tracer = trace_queries(args.db, args.slow_ms)
+        print("\n".join(tracer.format_summary(args.limit)))
+        print(f"{len(tracer.stats)} distinct statement(s) traced")
+        return 0
+    db = Database(args.db)
+    try:
+        if args.command == "rebuild-rollups":
+            db.rebuild_rollups(args.user)
+            print("Monthly rollups rebuilt")
+            return 0
+        if args.command == "rebuild-occurrences":
+            db.rebuild_occurrences(args.user)
+            print("Plan occurrences rebuilt")
+            return 0
+        if args.command == "reflag":
+            print(f"{db.reflag_transactions(args.user)} transaction flag(s) changed")
+            return 0
+        mismatches = db.verify_rollups(args.user)
+        for key in mismatches:
+            print("out of date: user %s, month %s, %s/%s, %s" % key)
+        print(f"{len(mismatches)} rollup key(s) out of date")
+        return 1 if mismatches else 0
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from utils.logging import log_error, log_debug
+
+class QueryExecutor:
+    """Run Database calls on worker threads and deliver their results on the Tk thread.
+
+    Results are collected by polling with after(), so callbacks may touch widgets.
+    Submitting again with the same key supersedes the earlier request: it is
+    cancelled if it has not started, and its result is dropped if it has.
+    """
+    def __init__(self, root, workers=2, poll_ms=30, profiler=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.profiler = profiler  # utils.profiler.Profiler timing each query and its callback
+        self.workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="penny-db")
+        self.pending = []
+        self.latest = {}
+        self.polling = False
+
+    def submit(self, fn, *args, key=None, callback=None, errback=None, **kwargs):
+        """Run fn(*args, **kwargs) on a worker; callback(result) or errback(exc) runs on the Tk thread."""
+        if self.profiler:
+            name = key or getattr(fn, "__name__", "query")
+            fn = self.profiler.wrap("query", name, fn)
+            if callback:
+                callback = self.profiler.wrap("render", name, callback)
+        if key is not None and key in self.latest:
+            if self.latest[key].cancel():
+                log_debug(0, "Cancelled superseded request %s", key)
+        future = self.workers.submit(fn, *args, **kwargs)
+        if key is not None:
+            self.latest[key] = future
+        self.pending.append((key, future, callback, errback))
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.poll_ms, self.poll)
+        return future
+
+    def poll(self):
+        waiting = []
+        for request in self.pending:
+            key, future, callback, errback = request
+            if not future.done():
+                waiting.append(request)
+                continue
+            if future.cancelled():
+                continue
+            if key is not None:
+                if self.latest.get(key) is not future:
+                    log_debug(0, "Dropped result of superseded request %s", key)
+                    continue
+                del self.latest[key]
+            self.deliver(future, callback, errback)
+        self.pending = waiting
+        if self.pending:
+            self.root.after(self.poll_ms, self.poll)
+        else:
+            self.polling = False
+
+    def deliver(self, future, callback, errback):
+        try:
+            error = future.exception()
+            if error is None:
+                if callback:
+                    callback(future.result())
+            elif errback:
+                errback(error)
+            else:
+                log_error(0, f"Background query failed: {str(error)}")
+        except tk.TclError as e:
+            # The page that asked for the data was destroyed before it arrived
+            log_debug(0, "Discarded background result for a destroyed widget: %s", str(e))
+
+    def shutdown(self):
+        """Cancel queued requests and stop the worker threads."""
+        for key, future, callback, errback in self.pending:
+            future.cancel()
+        self.pending = []
+        self.workers.shutdown(wait=False)
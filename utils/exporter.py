@@ -0,0 +1,153 @@
+import os
+import sys
+import csv
+import json
+import zlib
+import struct
+from array import array
+from datetime import datetime
+from utils.database import EXPORT_TABLES, date_key
+from utils.logging import log_info, log_debug
+
+# Columnar file layout (all integers little-endian):
+#   MAGIC, u32 header length, JSON header {"version", "table", "columns", "user_id", "start", "end", "created"}
+#   then row groups: u32 row count, and per column a u32 length followed by a zlib block;
+#   a row count of 0 ends the file.
+# An int block is a validity byte per row followed by int64 values; a text block is a validity
+# byte per row, a u32 UTF-8 length per row, then the concatenated UTF-8 bytes.
+MAGIC = b"PENNYCOL"
+VERSION = 1
+EXTENSIONS = {"csv": ".csv", "columnar": ".pcol"}
+BATCH_SIZE = 1000
+
+def key_range(start=None, end=None):
+    """Return the (start, end) YYYYMMDD keys for optional datetime bounds."""
+    if start is None or end is None:
+        return None, None
+    return date_key(start), date_key(end)
+
+def little_endian(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+def from_little_endian(values, data):
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+def encode_column(kind, values):
+    valid = bytes(0 if value is None else 1 for value in values)
+    if kind == "int":
+        return valid + little_endian(array("q", (0 if value is None else value for value in values)))
+    encoded = [b"" if value is None else str(value).encode("utf-8") for value in values]
+    return valid + little_endian(array("I", map(len, encoded))) + b"".join(encoded)
+
+def decode_column(kind, data, count):
+    valid = data[:count]
+    if kind == "int":
+        values = from_little_endian(array("q"), data[count:count + 8 * count])
+        return [value if valid[i] else None for i, value in enumerate(values)]
+    lengths = from_little_endian(array("I"), data[count:count + 4 * count])
+    offset = count + 4 * count
+    values = []
+    for i, length in enumerate(lengths):
+        values.append(data[offset:offset + length].decode("utf-8") if valid[i] else None)
+        offset += length
+    return values
+
+def export_csv(db, user_id, table, path, start=None, end=None, batch_size=BATCH_SIZE):
+    """Stream one table of a user's data to a CSV file and return the number of rows written."""
+    columns = EXPORT_TABLES[table][0]
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, kind in columns])
+        for rows in db.iter_export(user_id, table, *key_range(start, end), batch_size=batch_size):
+            writer.writerows(rows)
+            written += len(rows)
+    log_info(user_id, f"Exported {written} {table} rows to {path}")
+    return written
+
+def export_columnar(db, user_id, table, path, start=None, end=None, batch_size=BATCH_SIZE):
+    """Stream one table of a user's data to a compressed columnar file and return the number of rows written."""
+    columns = EXPORT_TABLES[table][0]
+    start_key, end_key = key_range(start, end)
+    header = json.dumps({
+        "version": VERSION,
+        "table": table,
+        "columns": columns,
+        "user_id": user_id,
+        "start": start_key,
+        "end": end_key,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }).encode("utf-8")
+    written = 0
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for rows in db.iter_export(user_id, table, start_key, end_key, batch_size=batch_size):
+            f.write(struct.pack("<I", len(rows)))
+            for (name, kind), values in zip(columns, zip(*rows)):
+                block = zlib.compress(encode_column(kind, values))
+                f.write(struct.pack("<I", len(block)) + block)
+            written += len(rows)
+        f.write(struct.pack("<I", 0))
+    log_info(user_id, f"Exported {written} {table} rows to {path}")
+    return written
+
+EXPORTERS = {"csv": export_csv, "columnar": export_columnar}
+
+def export_all(db, user_id, directory, fmt="csv", start=None, end=None, progress=None):
+    """Export every EXPORT_TABLES table into a directory and return {table: rows written}."""
+    counts = {}
+    for table in EXPORT_TABLES:
+        path = os.path.join(directory, f"penny_{table}{EXTENSIONS[fmt]}")
+        counts[table] = EXPORTERS[fmt](db, user_id, table, path, start, end)
+        if progress:
+            progress(table, counts[table])
+    return counts
+
+class ColumnarReader:
+    """Read a file written by export_columnar one row group at a time."""
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError(f"{path} is not a Penny columnar export")
+        (length,) = struct.unpack("<I", self.file.read(4))
+        self.header = json.loads(self.file.read(length).decode("utf-8"))
+        if self.header["version"] > VERSION:
+            self.file.close()
+            raise ValueError(f"Unsupported columnar export version {self.header['version']}")
+        self.columns = [tuple(column) for column in self.header["columns"]]
+        log_debug(self.header["user_id"], "Opened columnar export of %s", self.header['table'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        """Yield each row group as a {column: list of values} dict."""
+        while True:
+            (count,) = struct.unpack("<I", self.file.read(4))
+            if count == 0:
+                return
+            group = {}
+            for name, kind in self.columns:
+                (length,) = struct.unpack("<I", self.file.read(4))
+                group[name] = decode_column(kind, zlib.decompress(self.file.read(length)), count)
+            yield group
+
+    def read(self):
+        """Return the remaining rows as one {column: list of values} dict."""
+        data = {name: [] for name, kind in self.columns}
+        for group in self:
+            for name, values in group.items():
+                data[name].extend(values)
+        return data
+
+    def close(self):
+        self.file.close()
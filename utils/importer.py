@@ -0,0 +1,159 @@
+import csv
+from collections import Counter
+from datetime import datetime
+from utils.database import date_key
+from utils.logging import log_info, log_error
+
+PENNY_COLUMNS = ("date", "type", "category", "amount", "mode", "details")
+MPESA_COLUMNS = ("receipt no.", "completion time", "details", "transaction status", "paid in", "withdrawn")
+DATE_FORMATS = ("%b %d %Y", "%m/%d/%Y", "%Y-%m-%d", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S")
+TYPES = {"income": "Income", "expenses": "Expenses", "expense": "Expenses", "savings": "Savings", "saving": "Savings"}
+MODES = {"cash": "Cash", "mpesa": "Mpesa", "m-pesa": "Mpesa"}
+MPESA_CATEGORIES = (
+    ("customer transfer", "Transfer"),
+    ("funds received", "Funds Received"),
+    ("pay bill", "Pay Bill"),
+    ("merchant payment", "Merchant Payment"),
+    ("buy goods", "Buy Goods"),
+    ("airtime", "Airtime"),
+    ("customer withdrawal", "Withdrawal"),
+    ("deposit of funds", "Deposit"),
+    ("m-shwari", "M-Shwari"),
+    ("fuliza", "Fuliza"),
+)
+CHUNK_SIZE = 2000
+
+def parse_date(value):
+    """Return a statement date in the app's "%b %d %Y" format."""
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime("%b %d %Y")
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date: {value}")
+
+def parse_amount(value):
+    """Return a statement amount as a positive whole number."""
+    value = (value or "").replace(",", "").strip()
+    return abs(int(round(float(value)))) if value else 0
+
+def detect_format(header):
+    """Return "penny" or "mpesa" for a CSV header row, or None if it is neither."""
+    columns = {column.strip().lower() for column in header}
+    if all(column in columns for column in PENNY_COLUMNS[:5]):
+        return "penny"
+    if all(column in columns for column in MPESA_COLUMNS):
+        return "mpesa"
+    return None
+
+def mpesa_category(details):
+    details = details.lower()
+    for prefix, category in MPESA_CATEGORIES:
+        if prefix in details:
+            return category
+    return "M-Pesa"
+
+def penny_row(row):
+    type = TYPES[row["type"].strip().lower()]
+    mode = MODES[row["mode"].strip().lower()]
+    category = row["category"].strip()
+    amount = parse_amount(row["amount"])
+    if not category or amount <= 0:
+        raise ValueError("Missing category or amount")
+    return (parse_date(row["date"]), type, category, amount, mode, (row.get("details") or "").strip())
+
+def mpesa_row(row):
+    if row["transaction status"].strip().lower() != "completed":
+        return None
+    paid_in = parse_amount(row["paid in"])
+    withdrawn = parse_amount(row["withdrawn"])
+    if not paid_in and not withdrawn:
+        return None
+    details = row["details"].strip()
+    type = "Income" if paid_in else "Expenses"
+    note = f"{row['receipt no.'].strip()} {details}".strip()
+    return (parse_date(row["completion time"]), type, mpesa_category(details), paid_in or withdrawn, "Mpesa", note)
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yield (rows, skipped) chunks of transaction tuples parsed from a Penny or M-Pesa CSV."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = None
+        for line in reader:
+            # M-Pesa statements carry a preamble (name, period...) before the table
+            if detect_format(line):
+                header = [column.strip().lower() for column in line]
+                break
+        if header is None:
+            raise ValueError("Not a Penny or M-Pesa statement CSV")
+        convert = penny_row if detect_format(header) == "penny" else mpesa_row
+        rows = []
+        skipped = 0
+        for line in reader:
+            if not any(cell.strip() for cell in line):
+                continue
+            try:
+                row = convert(dict(zip(header, line)))
+            except (KeyError, ValueError, AttributeError):
+                row = None
+            if row is None:
+                skipped += 1
+                continue
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                yield rows, skipped
+                rows = []
+                skipped = 0
+        if rows or skipped:
+            yield rows, skipped
+
+def row_key(row):
+    date, type, category, amount, mode, details = row
+    return (date_key(date), type, category, amount, mode, details)
+
+def drop_duplicates(db, user_id, rows, seen):
+    """Return (rows not stored yet, duplicates dropped) for a chunk.
+
+    Rows are matched by value, one stored transaction per row. seen counts the keys of
+    earlier chunks' rows, each of which already matched or became a stored transaction;
+    it is updated with this chunk's keys.
+    """
+    keys = [row_key(row) for row in rows]
+    stored = Counter(db.transaction_counts(user_id, min(keys)[0], max(keys)[0])) - seen
+    seen.update(keys)
+    new_rows = []
+    for row, key in zip(rows, keys):
+        if stored[key] > 0:
+            stored[key] -= 1
+        else:
+            new_rows.append(row)
+    return new_rows, len(rows) - len(new_rows)
+
+def import_transactions(db, user_id, path, progress=None, chunk_size=CHUNK_SIZE):
+    """Import a CSV statement and return {"imported": n, "skipped": m, "duplicates": d}.
+
+    Each chunk is parsed first and then added in its own transaction, so other writes
+    get the writer between chunks. Rows already stored are skipped, so importing a
+    statement again, or after a failure part way through, only adds what is missing.
+    progress(imported, skipped) is called after each chunk from the calling thread.
+    """
+    imported = skipped = duplicates = 0
+    seen = Counter()  # keys of the rows read so far, stored or matched
+    try:
+        for rows, chunk_skipped in read_chunks(path, chunk_size):
+            chunk_duplicates = 0
+            if rows:
+                rows, chunk_duplicates = drop_duplicates(db, user_id, rows, seen)
+            if rows and not db.add_transactions(user_id, rows):
+                raise ValueError("Bulk insert failed")
+            imported += len(rows)
+            skipped += chunk_skipped
+            duplicates += chunk_duplicates
+            if progress:
+                progress(imported, skipped + duplicates)
+    except (OSError, ValueError, csv.Error) as e:
+        log_error(user_id, f"Import of {path} failed after {imported} transactions: {str(e)}")
+        raise
+    log_info(user_id, f"Imported {imported} transactions from {path}, skipped {skipped}, {duplicates} already imported")
+    return {"imported": imported, "skipped": skipped, "duplicates": duplicates}
@@ -1,26 +1,97 @@
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import os
-from datetime import datetime
+import sys
+import gzip
+import queue
+import atexit
+import shutil
 
-def setup_logging():
+# PENNY_LOG_LEVEL sets the default level; PENNY_LOG_LEVELS overrides it per subsystem, where a
+# subsystem is a module or package name, e.g. "utils.database=DEBUG,pages=WARNING".
+# PENNY_LOG_COMPRESS=1 gzips rotated log files.
+LOG_FILE = os.environ.get("PENNY_LOG_FILE", "penny_errors.log")
+LOG_LEVEL = os.environ.get("PENNY_LOG_LEVEL", "INFO")
+SUBSYSTEM_LEVELS = os.environ.get("PENNY_LOG_LEVELS", "")
+COMPRESS = os.environ.get("PENNY_LOG_COMPRESS", "") not in ("", "0")
+FORMAT = "%(asctime)s - %(levelname)s - UserID: %(user_id)s - %(message)s - %(pathname)s:%(lineno)d"
+
+LISTENER = None  # the QueueListener writing records to the file and console, once set up
+LOGGERS = {}  # caller module name -> its "PennyApp.<module>" logger
+
+def parse_levels(text):
+    """Return {subsystem: level} from "name=LEVEL,..." text, ignoring malformed entries."""
+    levels = {}
+    for item in text.split(","):
+        name, _, level = item.partition("=")
+        level = logging.getLevelName(level.strip().upper())
+        if name.strip() and isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+def gzip_namer(name):
+    return name + ".gz"
+
+def gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def setup_logging(path=LOG_FILE, level=LOG_LEVEL, levels=SUBSYSTEM_LEVELS, compress=COMPRESS):
+    """Send PennyApp logs through a queue to a file and console writer thread; safe to call more than once."""
+    global LISTENER
+    if LISTENER is not None:
+        return LISTENER
     logger = logging.getLogger("PennyApp")
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(level)
+    for name, subsystem_level in parse_levels(levels).items():
+        logging.getLogger(f"PennyApp.{name}").setLevel(subsystem_level)
 
-    handler = RotatingFileHandler("penny_errors.log", maxBytes=5*1024*1024, backupCount=3)
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - UserID: %(user_id)s - %(message)s - %(pathname)s:%(lineno)d")
+    formatter = logging.Formatter(FORMAT)
+    handler = RotatingFileHandler(path, maxBytes=5*1024*1024, backupCount=3)
+    if compress:
+        handler.namer = gzip_namer
+        handler.rotator = gzip_rotator
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
-
     console = logging.StreamHandler()
     console.setFormatter(formatter)
-    logger.addHandler(console)
 
-def log_info(user_id, message):
-    logging.getLogger("PennyApp").info(message, extra={"user_id": user_id})
+    records = queue.SimpleQueue()
+    for old in [h for h in logger.handlers if isinstance(h, QueueHandler)]:
+        logger.removeHandler(old)
+    logger.addHandler(QueueHandler(records))
+    LISTENER = QueueListener(records, handler, console)
+    LISTENER.start()
+    atexit.register(shutdown_logging)
+    return LISTENER
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread."""
+    global LISTENER
+    if LISTENER is not None:
+        LISTENER.stop()
+        for handler in LISTENER.handlers:
+            handler.close()
+        LISTENER = None
+
+def get_logger(module):
+    logger = LOGGERS.get(module)
+    if logger is None:
+        logger = LOGGERS[module] = logging.getLogger(f"PennyApp.{module}")
+    return logger
+
+def log(level, user_id, message, args, exc_info=False):
+    # The logger is picked by the calling module so levels can be set per subsystem;
+    # message % args is only built if that logger is enabled for the level.
+    logger = get_logger(sys._getframe(2).f_globals.get("__name__", "app"))
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args, extra={"user_id": user_id}, exc_info=exc_info, stacklevel=3)
+
+def log_info(user_id, message, *args):
+    log(logging.INFO, user_id, message, args)
 
-def log_error(user_id, message):
-    logging.getLogger("PennyApp").error(message, extra={"user_id": user_id}, exc_info=True)
+def log_error(user_id, message, *args):
+    log(logging.ERROR, user_id, message, args, exc_info=sys.exc_info()[0] is not None)
 
-def log_debug(user_id, message):
-    logging.getLogger("PennyApp").debug(message, extra={"user_id": user_id})
\ No newline at end of file
+def log_debug(user_id, message, *args):
+    log(logging.DEBUG, user_id, message, args)
@@ -0,0 +1,166 @@
+import os
+import time
+import queue
+import atexit
+import cProfile
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from utils.logging import log_info
+
+# Set PENNY_PROFILE=1 to record timings; PENNY_METRICS_LOG picks the metrics file.
+ENABLED = os.environ.get("PENNY_PROFILE", "") not in ("", "0")
+METRICS_LOG = os.environ.get("PENNY_METRICS_LOG", "penny_metrics.log")
+SUMMARY_INTERVAL = 60  # seconds between rolling summaries in the metrics log
+# Database query and write API timed by instrument_database; helpers such as fetchall,
+# commit or adjust_rollup are left out, their time counts toward the method calling them.
+DATABASE_METHODS = (
+    "signup", "login", "logout", "reset_password", "get_logged_in_user", "username_exists", "email_exists",
+    "load_user", "get_user_profile", "update_user_profile", "get_settings", "update_settings", "is_planning_enabled",
+    "get_categories", "add_category", "update_category", "delete_category",
+    "get_plans", "get_plan_totals", "get_variance", "add_plan", "copy_plan", "get_due", "plan_horizon",
+    "has_december_plan", "get_plan_amount", "get_plan_details",
+    "get_transactions", "get_transaction_cursor", "summarize", "get_recent_transactions", "get_daily_trends",
+    "get_weekly_trends", "get_monthly_trends", "get_yearly_trends", "add_transaction", "add_transactions",
+    "transaction_counts", "reflag_transactions", "delete_transaction", "undo_delete",
+    "rebuild_rollups", "verify_rollups", "rebuild_occurrences",
+)
+
+class Profiler:
+    """Collect wall time and SQL statement counts per UI action and Database method.
+
+    SQL statements are counted per thread through the connections' trace callbacks, so a
+    timing only includes the statements its own thread ran. Metrics lines are queued and
+    written to the file by a listener thread, so timing a UI action never waits on disk.
+    """
+    def __init__(self, path=METRICS_LOG, summary_interval=SUMMARY_INTERVAL):
+        self.stats = {}  # "kind:name" -> [calls, total seconds, max seconds, sql statements]
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.summary_interval = summary_interval
+        self.last_summary = time.perf_counter()
+        self.cprofile = None
+        self.listener = None
+        self.logger = logging.getLogger("PennyMetrics")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=1024 * 1024, backupCount=3, delay=True)
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+            records = queue.SimpleQueue()
+            self.logger.addHandler(QueueHandler(records))
+            self.listener = QueueListener(records, handler)
+            self.listener.start()
+            atexit.register(self.shutdown)
+
+    def sql_count(self):
+        return getattr(self.local, "sql", 0)
+
+    def count_sql(self, statement):
+        self.local.sql = self.sql_count() + 1
+
+    def watch_connections(self, pool):
+        """Count the statements run on every connection of a ConnectionPool."""
+        for conn in pool.connections():
+            conn.set_trace_callback(self.count_sql)
+
+    @contextmanager
+    def timed(self, kind, name):
+        started = time.perf_counter()
+        sql_before = self.sql_count()
+        try:
+            yield
+        finally:
+            self.record(f"{kind}:{name}", time.perf_counter() - started, self.sql_count() - sql_before)
+
+    def record(self, key, seconds, sql=0):
+        with self.lock:
+            stat = self.stats.setdefault(key, [0, 0.0, 0.0, 0])
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+            stat[3] += sql
+            due = time.perf_counter() - self.last_summary >= self.summary_interval
+        if not key.startswith("db:"):  # Database methods only show up in the summaries
+            self.logger.info(f"{key} {seconds * 1000:.1f} ms, {sql} SQL")
+        if due:
+            self.write_summary()
+
+    def wrap(self, kind, name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.timed(kind, name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def instrument(self, obj, names, kind):
+        """Replace the named methods of one object with timed wrappers."""
+        for name in names:
+            setattr(obj, name, self.wrap(kind, name, getattr(obj, name)))
+
+    def wrap_outermost(self, kind, name, function):
+        """Like wrap(), but a call made while another such wrapper runs on the thread is not timed on its own."""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if getattr(self.local, "nested", False):
+                return function(*args, **kwargs)
+            self.local.nested = True
+            try:
+                with self.timed(kind, name):
+                    return function(*args, **kwargs)
+            finally:
+                self.local.nested = False
+        return wrapper
+
+    def instrument_database(self, db, names=DATABASE_METHODS):
+        """Time the DATABASE_METHODS of an instance and count their SQL.
+
+        A method called by another one, such as get_settings calling load_user, counts
+        toward its caller only. Generators and context managers (iter_rows, bulk, ...)
+        are not listed: a wrapper would only time creating them.
+        """
+        for name in names:
+            setattr(db, name, self.wrap_outermost("db", name, getattr(db, name)))
+        self.watch_connections(db.pool)
+
+    def summary(self):
+        """Return (key, calls, total ms, mean ms, max ms, sql per call) rows, slowest total first."""
+        with self.lock:
+            rows = [(key, calls, total * 1000, total * 1000 / calls, longest * 1000, sql / calls)
+                    for key, (calls, total, longest, sql) in self.stats.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def write_summary(self):
+        with self.lock:
+            self.last_summary = time.perf_counter()
+        lines = [f"{key}: {calls} calls, total {total:.1f} ms, mean {mean:.1f} ms, max {longest:.1f} ms, {sql:.1f} SQL/call"
+                 for key, calls, total, mean, longest, sql in self.summary()]
+        self.logger.info("Summary\n    " + "\n    ".join(lines))
+
+    def shutdown(self):
+        """Write a final summary, then flush queued metrics and stop the writer thread."""
+        if self.listener is not None:
+            self.write_summary()
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+    def toggle_cprofile(self, directory="."):
+        """Start a cProfile capture, or stop the running one and dump it; returns the dump path."""
+        if self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+            log_info(0, "Started cProfile capture")
+            return None
+        self.cprofile.disable()
+        path = os.path.join(directory, f"penny_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+        self.cprofile.dump_stats(path)
+        self.cprofile = None
+        log_info(0, f"Wrote cProfile snapshot to {path}")
+        return path
+
+PROFILER = Profiler() if ENABLED else None
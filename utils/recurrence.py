@@ -0,0 +1,166 @@
+import re
+import json
+import calendar
+import functools
+from collections import namedtuple
+
+ORDINALS = {"1st": 1, "first": 1, "2nd": 2, "second": 2, "3rd": 3, "third": 3,
+            "4th": 4, "fourth": 4, "5th": 5, "fifth": 5}
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DAY_ABBRS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+ORDINAL_RE = "|".join(ORDINALS)
+WEEKDAY_RE = "|".join(WEEKDAYS)
+INTERVAL = re.compile(r"^every\s+(\d+)\s+days?(?:\s+from\s+(\d+))?$")
+MULTIPLE_DAYS = re.compile(r"^on\s+days?\s+(\d+(?:\s*,\s*\d+)*)$")
+NTH_WEEKDAY = re.compile(rf"^({ORDINAL_RE})\s+({WEEKDAY_RE})$")
+LAST_WEEKDAY = re.compile(rf"^last\s+({WEEKDAY_RE})$")
+NTH_WEEK = re.compile(rf"^every\s+(\d+)\s+weeks?\s+on\s+({WEEKDAY_RE})(?:\s+from\s+(\d+))?$")
+AND = re.compile(r"\s+and\s+")
+# One part of "1st and 3rd monday" or "1st monday and 2nd friday"; a bare ordinal takes the next weekday named
+WEEKDAY_INSTANCE = re.compile(rf"^({ORDINAL_RE})(?:\s+({WEEKDAY_RE}))?$")
+USAGE = ("Invalid custom recurrence. Use formats like 'every 5 days from 3', 'on days 1, 15', '2nd Tuesday', "
+         "'last Friday', 'every 2 weeks on Monday from 4', or '1st and 3rd Monday'.")
+
+# A parsed custom recurrence. Fields that do not apply to a kind are None;
+# days is a tuple of month days and instances a tuple of (nth, weekday) pairs.
+Rule = namedtuple("Rule", "kind interval start_day days weekday nth instances",
+                  defaults=(None, None, None, None, None, None))
+
+@functools.lru_cache(maxsize=256)
+def parse(text):
+    """Parse custom recurrence text into (Rule, None), or (None, error message)."""
+    text = " ".join(text.lower().split())
+    match = INTERVAL.match(text)
+    if match:
+        interval, start_day = int(match.group(1)), int(match.group(2) or 1)
+        if not (1 <= interval <= 31 and 1 <= start_day <= 31):
+            return None, "Invalid interval or start day. Use 'every N days [from M]' where N and M are 1–31."
+        return Rule("interval", interval=interval, start_day=start_day), None
+    match = MULTIPLE_DAYS.match(text)
+    if match:
+        days = tuple(int(day) for day in match.group(1).split(","))
+        if not all(1 <= day <= 31 for day in days):
+            return None, "Invalid days. Use 'on days 1, 15, 25' with days 1–31."
+        return Rule("multiple_days", days=days), None
+    match = NTH_WEEKDAY.match(text)
+    if match:
+        return Rule("nth_weekday", weekday=match.group(2), nth=ORDINALS[match.group(1)]), None
+    match = LAST_WEEKDAY.match(text)
+    if match:
+        return Rule("last_weekday", weekday=match.group(1)), None
+    match = NTH_WEEK.match(text)
+    if match:
+        interval, start_day = int(match.group(1)), int(match.group(3) or 1)
+        if not (1 <= interval <= 4 and 1 <= start_day <= 31):
+            return None, "Invalid week interval or start day. Use 'every N weeks on weekday [from M]' where N is 1–4 and M is 1–31."
+        return Rule("nth_week", interval=interval, start_day=start_day, weekday=match.group(2)), None
+    matches = [WEEKDAY_INSTANCE.match(part) for part in AND.split(text)]
+    # A single "nth weekday" was matched by NTH_WEEKDAY above, so this needs two or more parts
+    if len(matches) >= 2 and all(matches) and matches[-1].group(2):
+        instances, weekday = [], None
+        for match in reversed(matches):
+            weekday = match.group(2) or weekday
+            instances.append((ORDINALS[match.group(1)], weekday))
+        return Rule("weekday_combinations", instances=tuple(reversed(instances))), None
+    return None, USAGE
+
+def to_json(rule):
+    """Serialize a Rule to the compact JSON stored in plans.custom_period."""
+    if rule.kind == "interval":
+        data = {"type": rule.kind, "interval": rule.interval, "start_day": rule.start_day}
+    elif rule.kind == "multiple_days":
+        data = {"type": rule.kind, "days": list(rule.days)}
+    elif rule.kind == "nth_weekday":
+        data = {"type": rule.kind, "weekday": rule.weekday, "nth": rule.nth}
+    elif rule.kind == "last_weekday":
+        data = {"type": rule.kind, "weekday": rule.weekday}
+    elif rule.kind == "nth_week":
+        data = {"type": rule.kind, "weekday": rule.weekday, "interval": rule.interval, "start_day": rule.start_day}
+    else:
+        data = {"type": rule.kind, "instances": [{"weekday": weekday, "nth": nth} for nth, weekday in rule.instances]}
+    return json.dumps(data, separators=(",", ":"))
+
+@functools.lru_cache(maxsize=256)
+def from_json(text):
+    """Load a Rule from plans.custom_period JSON; raises ValueError if it is not a recurrence."""
+    try:
+        data = json.loads(text)
+        kind = data["type"]
+        if kind == "interval":
+            return Rule(kind, interval=data["interval"], start_day=data.get("start_day", 1))
+        if kind == "multiple_days":
+            return Rule(kind, days=tuple(data["days"]))
+        if kind == "nth_weekday":
+            return Rule(kind, weekday=data["weekday"], nth=data["nth"])
+        if kind == "last_weekday":
+            return Rule(kind, weekday=data["weekday"])
+        if kind == "nth_week":
+            return Rule(kind, interval=data["interval"], start_day=data.get("start_day", 1), weekday=data["weekday"])
+        if kind == "weekday_combinations":
+            return Rule(kind, instances=tuple((item["nth"], item["weekday"]) for item in data["instances"]))
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid custom recurrence {text!r}: {e}")
+    raise ValueError(f"Unknown custom recurrence type {kind!r}")
+
+def ordinal(n):
+    suffix = "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+def describe(rule):
+    """Return the text form of a Rule, as accepted by parse()."""
+    if rule.kind == "interval":
+        return f"every {rule.interval} days from {rule.start_day}"
+    if rule.kind == "multiple_days":
+        return f"on days {', '.join(map(str, rule.days))}"
+    if rule.kind == "nth_weekday":
+        return f"{ordinal(rule.nth)} {rule.weekday}"
+    if rule.kind == "last_weekday":
+        return f"last {rule.weekday}"
+    if rule.kind == "nth_week":
+        return f"every {rule.interval} weeks on {rule.weekday} from {rule.start_day}"
+    return " and ".join(f"{ordinal(nth)} {weekday}" for nth, weekday in rule.instances)
+
+def nth_weekday(year, month, weekday, nth):
+    """Return the day of the nth (1-5) weekday of a month, or None if the month has fewer."""
+    first = (WEEKDAYS.index(weekday) - calendar.weekday(year, month, 1)) % 7 + 1
+    day = first + 7 * (nth - 1)
+    return day if day <= calendar.monthrange(year, month)[1] else None
+
+def days_in(rule, year, month):
+    """Return the sorted days of a month on which a Rule falls due."""
+    last = calendar.monthrange(year, month)[1]
+    if rule.kind == "interval":
+        days = range(rule.start_day, last + 1, rule.interval)
+    elif rule.kind == "multiple_days":
+        days = [day for day in rule.days if day <= last]
+    elif rule.kind == "nth_weekday":
+        days = [nth_weekday(year, month, rule.weekday, rule.nth)]
+    elif rule.kind == "last_weekday":
+        days = [last - (calendar.weekday(year, month, last) - WEEKDAYS.index(rule.weekday)) % 7]
+    elif rule.kind == "nth_week":
+        first = rule.start_day + (WEEKDAYS.index(rule.weekday) - calendar.weekday(year, month, min(rule.start_day, last))) % 7
+        days = range(first, last + 1, 7 * rule.interval)
+    else:
+        days = [nth_weekday(year, month, weekday, nth) for nth, weekday in rule.instances]
+    return sorted({day for day in days if day is not None and day <= last})
+
+def plan_days(recurrence, due, custom_period, year, month):
+    """Return the days of a month on which a plan with the given recurrence columns falls due."""
+    last = calendar.monthrange(year, month)[1]
+    if recurrence == "Daily":
+        weekdays = {DAY_ABBRS.index(day.strip()) for day in (due or "").split(",") if day.strip() in DAY_ABBRS}
+        return [day for day in range(1, last + 1) if calendar.weekday(year, month, day) in weekdays]
+    if recurrence == "Monthly" and due:
+        if due == "last":
+            return [last]
+        day = int(due[:-2]) if due[:-2].isdigit() else None
+        return [day] if day and day <= last else []
+    if recurrence == "Custom" and custom_period:
+        return days_in(from_json(custom_period), year, month)
+    return []
+
+def plan_due_keys(recurrence, due, custom_period, year, month):
+    """Return YYYYMMDD keys for a plan's due dates; month 0 (a whole-year plan) covers all twelve months."""
+    months = range(1, 13) if month == 0 else [month]
+    return [year * 10000 + m * 100 + day for m in months for day in plan_days(recurrence, due, custom_period, year, m)]
@@ -0,0 +1,229 @@
+import os
+import re
+import bisect
+import itertools
+import sqlite3
+import logging
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from utils.logging import log_info, log_error
+
+# Set PENNY_SQL_TRACE=1 to time every statement; statements slower than PENNY_SLOW_QUERY_MS
+# are written with their query plan to PENNY_SLOW_QUERY_LOG.
+ENABLED = os.environ.get("PENNY_SQL_TRACE", "") not in ("", "0")
+SLOW_MS = float(os.environ.get("PENNY_SLOW_QUERY_MS", "50"))
+SLOW_LOG = os.environ.get("PENNY_SLOW_QUERY_LOG", "penny_slow_queries.log")
+HISTOGRAM_MS = (1, 5, 10, 50, 100, 500, 1000)  # bucket upper bounds; the last bucket is open-ended
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+IN_LIST = re.compile(r"\bIN \(\?(?:, ?\?)*\)", re.IGNORECASE)
+VALUES_LIST = re.compile(r"\b(VALUES \([^()]*\))(?:, ?\([^()]*\))+", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+def normalize(sql):
+    """Return a statement with string literals, IN (?, ...) lists and multi-row VALUES collapsed, so variants group together."""
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = WHITESPACE.sub(" ", sql).strip()
+    sql = IN_LIST.sub("IN (?, ...)", sql)
+    return VALUES_LIST.sub(r"\1, ...", sql)
+
+def is_open(conn):
+    try:
+        conn.total_changes
+        return True
+    except sqlite3.ProgrammingError:
+        return False
+
+class SqlTracer:
+    """Per-statement timings, row counts and latency histograms for traced connections."""
+    def __init__(self, slow_ms=SLOW_MS, path=SLOW_LOG):
+        self.slow_ms = slow_ms
+        self.stats = {}  # normalized sql -> [calls, total seconds, max seconds, rows, params, histogram counts]
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("PennySlowQueries")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=1024 * 1024, backupCount=3, delay=True)
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+            self.logger.addHandler(handler)
+
+    def record(self, sql, params, seconds, rows, plan=None, conn=None, bound=()):
+        """Count one run of a statement; params is how many values were bound.
+
+        A slow statement is logged with plan, or else explained on conn with the bound values.
+        """
+        statement = normalize(sql)
+        with self.lock:
+            stat = self.stats.get(statement)
+            if stat is None:
+                stat = self.stats[statement] = [0, 0.0, 0.0, 0, 0, [0] * (len(HISTOGRAM_MS) + 1)]
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+            stat[3] += rows
+            stat[4] += params
+            stat[5][bisect.bisect_left(HISTOGRAM_MS, seconds * 1000)] += 1
+        if self.is_slow(seconds):
+            if plan is None and conn is not None:
+                plan = self.explain(conn, sql, bound)
+            self.log_slow(sql, params, seconds, rows, plan or [])
+
+    def is_slow(self, seconds):
+        return seconds * 1000 >= self.slow_ms
+
+    def explain(self, conn, sql, bound):
+        """Return the query plan lines of a statement, or [] if it cannot be explained on conn."""
+        if sql.lstrip().split(None, 1)[0].upper() not in EXPLAINABLE or not is_open(conn):
+            return []
+        try:
+            # A plain cursor, so the EXPLAIN itself is not traced
+            cursor = conn.cursor(sqlite3.Cursor)
+            return [row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", bound).fetchall()]
+        except sqlite3.Error as e:
+            return [f"(no plan: {str(e)})"]
+
+    def log_slow(self, sql, params, seconds, rows, plan):
+        self.logger.info(f"{seconds * 1000:.1f} ms, {rows} rows, {params} params: {WHITESPACE.sub(' ', sql).strip()}"
+                         + "".join(f"\n    {line}" for line in plan))
+
+    def summary(self):
+        """Return (statement, calls, total ms, mean ms, max ms, rows per call, params, histogram) rows, slowest total first."""
+        with self.lock:
+            rows = [(statement, calls, total * 1000, total * 1000 / calls, longest * 1000, rows / calls,
+                     params // calls, list(histogram))
+                    for statement, (calls, total, longest, rows, params, histogram) in self.stats.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def format_summary(self, limit=20):
+        """Return the summary as text lines, with each histogram as "<=1ms:n <=5ms:n ... >1000ms:n"."""
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_MS] + [f">{HISTOGRAM_MS[-1]}ms"]
+        lines = []
+        for statement, calls, total, mean, longest, rows, params, histogram in self.summary()[:limit]:
+            buckets = " ".join(f"{label}:{count}" for label, count in zip(labels, histogram) if count)
+            lines.append(f"{calls} calls, total {total:.1f} ms, mean {mean:.2f} ms, max {longest:.1f} ms, "
+                         f"{rows:.1f} rows/call, {params} params [{buckets}]\n    {statement}")
+        return lines
+
+    def write_summary(self):
+        self.logger.info("Summary\n" + "\n".join(self.format_summary()))
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+class TracingCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's duration and row count to its connection's tracer.
+
+    A statement is reported when it finishes: right away if it returns no rows, once its
+    rows run out, or when the next one starts or the cursor is closed. A statement that
+    is already slow when it runs is explained then; one still pending when the cursor
+    is released is reported without running EXPLAIN, as its connection may be closed.
+    """
+    pending = None  # [sql, params, seconds, rows, bound values, plan] of the statement not yet reported
+
+    def finish(self, released=False):
+        pending, self.pending = self.pending, None
+        if pending is not None:
+            sql, params, seconds, rows, bound, plan = pending
+            if rows == 0 and self.rowcount > 0:
+                rows = self.rowcount  # rows changed by an INSERT/UPDATE/DELETE
+            conn = None if released else self.connection
+            self.connection.tracer.record(sql, params, seconds, rows, plan, conn, bound)
+
+    def start(self, sql, params, seconds, bound):
+        plan = None
+        if self.connection.tracer.is_slow(seconds):
+            plan = self.connection.tracer.explain(self.connection, sql, bound)
+        self.pending = [sql, params, seconds, 0, bound, plan]
+        if self.description is None:
+            self.finish()  # no rows to fetch, so the statement is done
+
+    def execute(self, sql, params=()):
+        self.finish()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self.start(sql, len(params), time.perf_counter() - started, params)
+
+    def executemany(self, sql, rows):
+        self.finish()
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return super().executemany(sql, ())  # an empty batch runs nothing, so there is nothing to report
+        params = 0
+
+        def counted():
+            nonlocal params
+            for row in itertools.chain((first,), rows):
+                params += len(row)
+                yield row
+
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, counted())
+        finally:
+            self.start(sql, params, time.perf_counter() - started, first)
+
+    def timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        if self.pending is not None:
+            self.pending[2] += time.perf_counter() - started
+            self.pending[3] += len(result) if isinstance(result, list) else result is not None
+        return result
+
+    def fetchone(self):
+        row = self.timed_fetch(super().fetchone)
+        if row is None:
+            self.finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self.timed_fetch(super().fetchmany, size)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        rows = self.timed_fetch(super().fetchall)
+        self.finish()
+        return rows
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self.finish(released=True)
+        except Exception as e:
+            log_error(0, "Could not report traced statement: %s", str(e))
+
+class TracingConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute(), are TracingCursors."""
+    tracer = None
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, rows):
+        return self.cursor().executemany(sql, rows)
+
+def connect(tracer, *args, **kwargs):
+    """Open a TracingConnection that reports to tracer."""
+    conn = sqlite3.connect(*args, factory=TracingConnection, **kwargs)
+    conn.tracer = tracer
+    return conn
+
+TRACER = SqlTracer() if ENABLED else None
+if TRACER:
+    log_info(0, f"SQL tracing on, statements over {SLOW_MS:g} ms go to {SLOW_LOG}")
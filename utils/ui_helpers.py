@@ -0,0 +1,29 @@
+import tkinter as tk
+from tkinter import ttk
+from datetime import datetime
+
+def create_greeting_label(parent, db, user_id):
+    """Return a label greeting the user by name for the time of day."""
+    profile = db.get_user_profile(user_id)
+    name = profile[0] if profile else "there"
+    hour = datetime.now().hour
+    if hour < 12:
+        greeting = "Good morning"
+    elif hour < 18:
+        greeting = "Good afternoon"
+    else:
+        greeting = "Good evening"
+    return ttk.Label(parent, text=f"{greeting}, {name}!", font=("Arial", 12, "bold"))
+
+def create_navigation_bar(parent, switch_page_callback, current_page, planning_enabled=True):
+    """Return the page navigation frame with the current page highlighted."""
+    nav_frame = ttk.Frame(parent)
+    for page_name in ["Dashboard", "Planning", "Tracking", "Settings"]:
+        if page_name == "Planning" and not planning_enabled:
+            continue
+        if page_name == current_page:
+            ttk.Button(nav_frame, text=page_name, style="Success.TButton").pack(side=tk.LEFT, padx=5)
+        else:
+            ttk.Button(nav_frame, text=page_name,
+                       command=lambda name=page_name: switch_page_callback(name)).pack(side=tk.LEFT, padx=5)
+    return nav_frame